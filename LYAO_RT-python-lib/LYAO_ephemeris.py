@@ -0,0 +1,118 @@
+####################################################################################################
+# LYAO Ephemeris
+# Contains functions for building a yearly Shadow geometry table for one site & pointing
+# 	with a few long Shadow runs, saving it as a compressed NumPy table, and answering
+# 	any time window by interpolating the table instead of launching Shadow again
+####################################################################################################
+# Dependencies: LYAO_inputsbuilder.py, shadow.exe (Jeff Percival, UW-Mad)
+# Outstanding Python Modules: numpy, pandas
+####################################################################################################
+# BEGIN CODE
+####################################################################################################
+
+### IMPORT MODULES ###
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from LYAO_inputsbuilder import *
+
+## Shadow columns stored in the table
+ephcols = ['ra','dec','shddist','shdalt','targaz','targzd','sunaz','sunzd','diffaz',
+	'last','vlsr','glon','glat','targha']
+
+## Periodic columns: (period, lower bound of the range Shadow prints them in)
+#  These are unwrapped when the table is built so interpolation never crosses a wrap
+ephperiod = {'ra':(24,0),'last':(24,0),'glon':(24,0),'targha':(24,0),'targaz':(360,-180),'sunaz':(360,-180)}
+
+####################################################################################################
+## Convert Shadow time strings ("YYYY MM DD HH MM SS[.SSS]") to numpy datetime64 seconds
+#  Shadow's seconds drift (e.g. 59.987 or 60.000), so they are rounded to the nearest second
+
+def shd2dt64(tm):
+	def convert(t):
+		Y,m,d,H,M,S = t.split()
+		return np.datetime64('%s-%s-%sT%s:%s'%(Y,m,d,H,M),'s')+np.timedelta64(int(round(float(S))),'s')
+	return np.array([convert(t) for t in np.atleast_1d(tm)])
+
+####################################################################################################
+## Times Shadow prints for an interval (start_time, end_time, time_interval)
+#  Shadow steps a Julian date by time_interval minutes while it is not past end_time, so
+#  	rounding in the sum decides whether end_time itself is printed (it is for -dt 1 or 60
+#  	over whole hours, but not for -dt 10); the same sum is done here in double precision
+
+def shdsteps(time):
+	start,end = shd2dt64([time[0],time[1]])
+	def jd(t):
+		day = t.astype('datetime64[D]')
+		return (day-np.datetime64('1970-01-01','D')).astype(float)+2440587.5+(t-day).astype(float)/86400
+	n = int((end-start)/np.timedelta64(int(time[2]),'m'))+2
+	steps = np.add.accumulate(np.r_[jd(start),np.full(n,time[2]/1440.)])
+	return start+np.arange(np.count_nonzero(steps <= jd(end)))*np.timedelta64(int(time[2]),'m')
+
+####################################################################################################
+## Build the geometry table for a whole year
+#  Runs Shadow once per chunk (nchunks equal pieces of the year) at dt-minute cadence
+#  The table runs pad days past each end of the year, since the AM & PM windows of the first
+#  	and last nights cross the year boundary in UTC
+#  Linear interpolation error in shdalt is ~1 km at dt=5 and ~0.05 km at dt=1
+#  Returns a dict of numpy arrays keyed by column, plus 'utc' (datetime64[s]) and metadata
+
+def buildephemeris(loc,year,dt=1,radec=None,hadec=None,azel=None,shdpath='./Shadow/',nchunks=12,pad=2):
+	first,last = datetime(year,1,1)-timedelta(days=pad),datetime(year+1,1,1)+timedelta(days=pad)
+	edges = [first+(last-first)*i/nchunks for i in range(nchunks+1)]
+	edges = [e.replace(microsecond=0) for e in edges]
+	dfs = []
+	for start,end in zip(edges[:-1],edges[1:]):
+		dfs.append(shadow(loc,(dt2shd(start),dt2shd(end),dt),radec=radec,hadec=hadec,azel=azel,shdpath=shdpath))
+	return ephtable(pd.concat(dfs,ignore_index=True),loc,dt,radec,hadec,azel)
+
+## Geometry table from Shadow output at a regular cadence (any span)
+def ephtable(df,loc,dt,radec=None,hadec=None,azel=None):
+	eph = {'utc':shd2dt64(df.utc.tolist())}
+	for col in ephcols:
+		x = df[col].to_numpy(dtype=float)
+		if col in ephperiod:
+			x = np.unwrap(x,period=ephperiod[col][0])
+		eph[col] = x.astype(np.float32)
+	eph['loc'] = np.array(repr(loc))
+	eph['pointing'] = np.array(repr((radec,hadec,azel)))
+	eph['dt'] = np.array(dt)
+	return eph
+
+####################################################################################################
+## Save & load a geometry table as a compressed .npz file
+
+def saveephemeris(eph,fpath):
+	np.savez_compressed(fpath,**eph)
+	return None
+
+def loadephemeris(fpath):
+	with np.load(fpath) as npz:
+		return {key:npz[key] for key in npz.files}
+
+####################################################################################################
+## Look up a Shadow time input in the geometry table
+#  time takes the same forms as shadow(): (start_time, end_time, time_interval) or a single time
+#  Returns a DataFrame with the same columns as shadow(), interpolated linearly in time
+#  Raises ValueError for times outside the table (LYAO_sweep.runinmemory then runs Shadow)
+
+def ephlookup(eph,time):
+	if len(time) == 3:
+		tms = shdsteps(time)
+	else:
+		tms = shd2dt64(time if isinstance(time,str) else time[0])
+
+	utc = eph['utc'].astype(np.int64)
+	t = tms.astype(np.int64)
+	if t.min() < utc[0] or t.max() > utc[-1]:
+		raise ValueError('Time window %s is outside the geometry table (%s to %s)'%(time,eph['utc'][0],eph['utc'][-1]))
+
+	d = {}
+	for col in ephcols:
+		x = np.interp(t,utc,eph[col].astype(float))
+		if col in ephperiod:
+			period,lo = ephperiod[col]
+			x = (x-lo)%period+lo
+		d[col] = x
+	d['utc'] = [s.replace('-',' ').replace('T',' ').replace(':',' ')+'.000' for s in tms.astype(str)]
+	return pd.DataFrame(d)
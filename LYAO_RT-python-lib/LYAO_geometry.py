@@ -0,0 +1,416 @@
+####################################################################################################
+# LYAO Geometry
+# Contains a NumPy version of the Shadow geometry: sun & target zenith distance and azimuth,
+# 	and the distance & altitude at which a line of sight leaves the Earth's shadow, computed
+# 	for a whole array of times in one call without launching the Shadow executable
+# Contains a function for checking it against the Shadow executable
+####################################################################################################
+# Dependencies: LYAO_inputsbuilder.py, LYAO_ephemeris.py,
+# 	shadow.exe (Jeff Percival, UW-Mad) for geovalidate only
+# Outstanding Python Modules: numpy, pandas
+####################################################################################################
+# Accuracy against the Shadow executable at night (see geotol & geovalidate):
+# 	shadow distance & altitude		per pointing, max over night rows (median ~0.02% for all):
+# 										zenith		0.1%
+# 										ra/dec		0.1% below zd 60, 0.15% to the horizon
+# 										az/el		0.1% below zd 60, 0.35% to the horizon
+# 										ha/dec		0.1% below zd 60, 0.65% to the horizon,
+# 										against Shadow run per time (see below)
+# 	last							0.05 s of time
+# 	target zd/az, ha				Shadow's print precision (0.1 deg) for az/el & ha/dec
+# 									pointings; RA/Dec pointings within 0.3 deg (ha 0.04 hr, as
+# 									an arc on the sky, i.e. times cos dec)
+# 	sun zd/az, diff-az				0.5 deg (azimuths as an arc on the sky, i.e. times sin sun zd)
+# 	ra/dec, l/b						0.2 deg
+# 	vlsr							1 km/s
+# Shadow's shadow follows the geometric Sun, which is what is computed here. The sun & target
+# 	angles Shadow prints pass through its refraction model, which moves the Sun by ~0.2 deg
+# 	below the horizon, so those are the columns with the loosest tolerances.
+# The shadow is a cylinder of the WGS84 equatorial radius plus the screening height, and
+# 	altitudes are measured above that equatorial radius, as in Shadow.
+# Shadow prints meaningless shadow distances when the site itself is sunlit; here they are 0
+# Shadow takes ha/dec & az/el pointings as observed positions and removes its refraction from
+# 	them (up to 0.2 deg near the horizon); the same is done here (see shdrefr)
+# Over an interval Shadow lets an ha/dec pointing drift a little every step (a few deg over a
+# 	night, tens of deg over 10 hr at -dt 1), so its ha/dec intervals differ from single -utc
+# 	runs at the same times by several % in shadow altitude; here the pointing is held, as in
+# 	the single runs
+####################################################################################################
+# BEGIN CODE
+####################################################################################################
+
+### IMPORT MODULES ###
+import subprocess
+import numpy as np
+import pandas as pd
+from LYAO_inputsbuilder import shdbatch
+from LYAO_ephemeris import shd2dt64, shdsteps
+
+## Site presets: (latitude deg, east longitude deg, altitude m), as built into Shadow
+geosites = {'pbo':(43+4/60+39.7/3600,-(89+40/60+18/3600),359.),
+	'wiyn':(31+57/60+29.099/3600,-(111+35/60+59.999/3600),2093.09),
+	'ctio':(-(30+42/60+46.8/3600),-(70+47/60+56.399/3600),2200.),
+	'erau':(29+11/60+23.64/3600,-(81+2/60+53.519/3600),0.)}
+geosites['kpno'] = geosites['wiyn']
+
+## WGS84 ellipsoid (km), astronomical unit (km)
+wgsa = 6378.137
+wgsf = 1/298.257223563
+au = 149597870.7
+
+## Solar motion with respect to the LSR: 20 km/s toward RA 18h, Dec +30 (B1900), in J2000
+lsrspeed = 20.
+lsrapex = (271.0332,29.9931)
+
+## Refraction Shadow removes from ha/dec & az/el pointings: A tan z + B tan^3 z (arcsec) at the
+#  	observed zenith distance z (deg), held at its shdrefz value beyond that; fitted to Shadow's
+#  	output to 0.2 arcsec
+shdrefr = (60.37,-0.06353)
+shdrefz = 86.52
+
+## Tolerances used by geovalidate, in the units of each column (relative for georel columns)
+geotol = {'sunzd':0.5,'sunaz':0.5,'targzd':0.3,'targaz':0.3,'diffaz':0.6,
+	'shddist':0.0075,'shdalt':0.0075,'last':0.05/3600,'targha':0.04,
+	'ra':0.2/15,'dec':0.2,'glon':0.2/15,'glat':0.2,'vlsr':1.}
+georel = ['shddist','shdalt']
+
+####################################################################################################
+## Input helpers
+
+def sexagesimal(x):
+	# "[hr/dg] [mn] [sec]" strings (as passed to Shadow) or numbers, to decimal
+	if isinstance(x,str):
+		parts = [float(p) for p in x.split()]
+		sign = -1 if x.strip().startswith('-') else 1
+		return sign*sum(abs(p)/60**i for i,p in enumerate(parts))
+	return float(x)
+
+def geosite(loc):
+	# loc takes the same forms as shadow(): a preset, or (longitude, latitude, altitude)
+	if isinstance(loc,str):
+		return geosites[loc]
+	return (sexagesimal(loc[1]),sexagesimal(loc[0]),sexagesimal(loc[2]))
+
+def geotimes(time):
+	# time takes the same forms as shadow(): (start_time, end_time, time_interval) or a single
+	# 	time string; or any array of datetimes. Intervals give the times Shadow prints, which
+	# 	may or may not include the end (see LYAO_ephemeris.shdsteps)
+	if isinstance(time,str):
+		return shd2dt64(time).astype('datetime64[ms]')
+	if len(time) == 3 and isinstance(time[0],str) and not isinstance(time[2],str):
+		return shdsteps(time).astype('datetime64[ms]')
+	return np.asarray(time,dtype='datetime64[ms]')
+
+####################################################################################################
+## Time, sun & frames
+#  Angles in degrees; jd is the UTC Julian date (UT1 - UTC is ignored)
+
+def julian(tms):
+	return (tms-np.datetime64('2000-01-01T12:00','ms')).astype('timedelta64[ms]').astype(float)/864e5+2451545.
+
+def nutation(jd):
+	# Main terms of the nutation in longitude & obliquity, and the mean obliquity (deg)
+	T = (jd-2451545.)/36525
+	om = np.radians(125.04452-1934.136261*T)
+	L = np.radians(280.4665+36000.7698*T)
+	Lm = np.radians(218.3165+481267.8813*T)
+	dpsi = (-17.20*np.sin(om)-1.32*np.sin(2*L)-0.23*np.sin(2*Lm)+0.21*np.sin(2*om))/3600
+	deps = (9.20*np.cos(om)+0.57*np.cos(2*L)+0.10*np.cos(2*Lm)-0.09*np.cos(2*om))/3600
+	eps0 = 23.439291111-0.013004167*T-1.639e-7*T**2+5.036e-7*T**3
+	return dpsi,deps,eps0
+
+def sidereal(jd,lon):
+	# Local apparent sidereal time (deg)
+	T = (jd-2451545.)/36525
+	gmst = 280.46061837+360.98564736629*(jd-2451545.)+0.000387933*T**2-T**3/38710000
+	dpsi,deps,eps0 = nutation(jd)
+	return (gmst+dpsi*np.cos(np.radians(eps0+deps))+lon)%360
+
+def sunlongitude(jd):
+	# Apparent ecliptic longitude (deg) and distance (au) of the Sun, low precision (~0.01 deg)
+	T = (jd-2451545.)/36525
+	L0 = 280.46646+36000.76983*T+0.0003032*T**2
+	M = np.radians(357.52911+35999.05029*T-0.0001537*T**2)
+	e = 0.016708634-0.000042037*T-0.0000001267*T**2
+	C = ((1.914602-0.004817*T-0.000014*T**2)*np.sin(M)+(0.019993-0.000101*T)*np.sin(2*M)
+		+0.000289*np.sin(3*M))
+	R = 1.000001018*(1-e**2)/(1+e*np.cos(M+np.radians(C)))
+	lam = L0+C-0.00569-0.00478*np.sin(np.radians(125.04-1934.136*T))
+	return lam,R
+
+def sunposition(jd):
+	# Apparent RA & Dec of date (deg) and distance (au) of the Sun
+	lam,R = sunlongitude(jd)
+	dpsi,deps,eps0 = nutation(jd)
+	lam,eps = np.radians(lam),np.radians(eps0+deps)
+	ra = np.degrees(np.arctan2(np.cos(eps)*np.sin(lam),np.cos(lam)))%360
+	dec = np.degrees(np.arcsin(np.sin(eps)*np.sin(lam)))
+	return ra,dec,R
+
+def unit(ra,dec):
+	ra,dec = np.radians(ra),np.radians(dec)
+	return np.stack([np.cos(dec)*np.cos(ra),np.cos(dec)*np.sin(ra),np.sin(dec)],axis=-1)
+
+def angles(v):
+	v = v/np.linalg.norm(v,axis=-1,keepdims=True)
+	return np.degrees(np.arctan2(v[...,1],v[...,0]))%360,np.degrees(np.arcsin(np.clip(v[...,2],-1,1)))
+
+def rotation(axis,ang):
+	# Rotation matrices (..., 3, 3) about a coordinate axis, for an array of angles (deg)
+	c,s = np.cos(np.radians(ang)),np.sin(np.radians(ang))
+	o,l = np.zeros_like(c),np.ones_like(c)
+	i,j = [(1,2),(2,0),(0,1)][axis]
+	m = np.stack([np.stack([l,o,o],-1),np.stack([o,l,o],-1),np.stack([o,o,l],-1)],-2)
+	m[...,i,i],m[...,i,j],m[...,j,i],m[...,j,j] = c,s,-s,c
+	return m
+
+def precession(jd):
+	# Matrix from J2000 mean equator & equinox to the true equator & equinox of date
+	T = (jd-2451545.)/36525
+	zeta = (2306.2181*T+0.30188*T**2+0.017998*T**3)/3600
+	z = (2306.2181*T+1.09468*T**2+0.018203*T**3)/3600
+	theta = (2004.3109*T-0.42665*T**2-0.041833*T**3)/3600
+	P = rotation(2,-z)@rotation(1,theta)@rotation(2,-zeta)
+	dpsi,deps,eps0 = nutation(jd)
+	N = rotation(0,-(eps0+deps))@rotation(2,-dpsi)@rotation(0,eps0)
+	return N@P
+
+def earthvelocity(jd):
+	# Heliocentric velocity of the Earth (km/s) in the equatorial frame of date
+	def position(jd):
+		lam,R = sunlongitude(jd)
+		dpsi,deps,eps0 = nutation(jd)
+		return -R[...,None]*au*(rotation(0,-(eps0+deps))@unit(lam,0*lam)[...,None])[...,0]
+	dt = 1/24
+	return (position(jd+dt/2)-position(jd-dt/2))/(dt*86400)
+
+## Rotation from J2000 equatorial to galactic coordinates
+galmatrix = np.array([[-0.0548755604,-0.8734370902,-0.4838350155],
+	[0.4941094279,-0.4448296300,0.7469822445],
+	[-0.8676661490,-0.1980763734,0.4559837762]])
+
+def geoframe(lat,lon,alt,jd):
+	# Local sidereal time, site position (km) and local up, north & east in the frame of date
+	theta = sidereal(jd,lon)
+	phi = np.radians(lat)
+	e2 = wgsf*(2-wgsf)
+	N = wgsa/np.sqrt(1-e2*np.sin(phi)**2)
+	h = alt/1e3
+	O = np.stack([(N+h)*np.cos(phi)*np.cos(np.radians(theta)),(N+h)*np.cos(phi)*np.sin(np.radians(theta)),
+		(N*(1-e2)+h)*np.sin(phi)+0*theta],-1)
+	up = unit(theta,lat+0*theta)
+	north = unit(theta+180,90-lat+0*theta)
+	east = unit(theta+90,0*theta)
+	return theta,O,up,north,east
+
+def unrefract(d,up):
+	# Observed line of sight to the true one, raised in zenith distance by Shadow's refraction
+	h = d-np.sum(d*up,-1)[...,None]*up
+	norm = np.linalg.norm(h,axis=-1,keepdims=True)
+	zd = np.degrees(np.arctan2(norm[...,0],np.sum(d*up,-1)))
+	t = np.tan(np.radians(np.minimum(zd,shdrefz)))
+	zt = np.radians(zd+(shdrefr[0]*t+shdrefr[1]*t**3)/3600)
+	h = np.divide(h,norm,out=np.zeros_like(h),where=norm > 0)
+	return np.sin(zt)[...,None]*h+np.cos(zt)[...,None]*up
+
+####################################################################################################
+## Earth shadow along each line of sight
+#  O: site position (km), d: unit line of sight, s: unit vector to the Sun, R: shadow radius (km)
+#  As in Shadow, the shadow is the cylinder of radius R behind the Earth along the anti-sun axis
+#  	(sunlight as parallel rays from the centre of the disk), so the exit is a quadratic root
+
+def shadowexit(O,d,s,R):
+	Operp = O-np.sum(O*s,-1)[...,None]*s
+	dperp = d-np.sum(d*s,-1)[...,None]*s
+	A = np.sum(dperp*dperp,-1)
+	B = np.sum(Operp*dperp,-1)
+	C = np.sum(Operp*Operp,-1)-R**2
+
+	# Inside the cylinder C < 0, so the far root is where the line of sight leaves it
+	with np.errstate(divide='ignore',invalid='ignore'):
+		t = (-B+np.sqrt(B**2-A*C))/A
+	t = np.where(np.isfinite(t),t,np.inf)
+
+	# Sites on the day side, or outside the cylinder, are already sunlit
+	return np.where((C >= 0) | (np.sum(O*s,-1) > 0),0.,t)
+
+####################################################################################################
+## Geometry for each time
+#  loc & time take the same forms as shadow(); pointings are
+#  	radec = (RA hr, Dec deg), J2000 as in Shadow
+#  	hadec = (HA hr, Dec deg), of date
+#  	azel = (Az hr east of north, El deg), as Shadow reads -az (6 = east, 18 = west)
+#  As in Shadow, ha/dec & az/el are observed positions: targzd & targaz are printed as given,
+#  	and everything else follows the line of sight with Shadow's refraction removed
+#  The default pointing is the zenith. height is Shadow's screening height (km)
+#  Returns a DataFrame with the same columns as shadow()
+
+def geometry(loc,time,radec=None,hadec=None,azel=None,height=102.):
+	lat,lon,alt = geosite(loc)
+	tms = geotimes(time)
+	jd = julian(tms)
+	theta,O,up,north,east = geoframe(lat,lon,alt,jd)
+	v = earthvelocity(jd)
+
+	## Line of sight in the frame of date; catalogue positions get annual aberration
+	PN = precession(jd)
+	if radec is not None:
+		d = PN@unit(radec[0]*15,radec[1])+v/299792.458
+		d = d/np.linalg.norm(d,axis=-1,keepdims=True)
+	elif hadec is not None:
+		d = unit(theta-hadec[0]*15,hadec[1]+0*theta)
+	else:
+		az,el = azel if azel is not None else (0.,90.)
+		az,el = np.radians(az*15),np.radians(el)
+		d = np.cos(el)*(np.cos(az)*north+np.sin(az)*east)+np.sin(el)*up
+
+	## Sun
+	sra,sdec,R = sunposition(jd)
+	s = unit(sra,sdec)
+
+	def azzd(v):
+		return (np.degrees(np.arctan2(np.sum(v*east,-1),np.sum(v*north,-1))),
+			np.degrees(np.arccos(np.clip(np.sum(v*up,-1),-1,1))))
+	targaz,targzd = azzd(d)
+	if radec is None and hadec is None:
+		# Keep the requested azimuth, which is undefined at the zenith
+		targaz = ((azel[0]*15 if azel is not None else 0.)+180)%360-180+0*targzd
+	if radec is None:
+		d = unrefract(d,up)
+	sunaz,sunzd = azzd(s)
+	diffaz = np.abs(targaz-sunaz)
+	diffaz = np.where(diffaz > 180,360-diffaz,diffaz)
+
+	## Shadow distance & altitude
+	t = shadowexit(O,d,s,wgsa+height)
+	shddist = np.where(np.isfinite(t),t,np.nan)
+	shdalt = np.linalg.norm(O+shddist[...,None]*d,axis=-1)-wgsa
+
+	## Catalogue coordinates: of date, then J2000 with annual aberration removed
+	dra,ddec = angles(d)
+	targha = ((theta-dra)/15)%24
+	d2k = d-v/299792.458
+	d2k = (np.swapaxes(PN,-1,-2)@d2k[...,None])[...,0]
+	ra,dec = angles(d2k)
+	glon,glat = angles(d2k@galmatrix.T)
+
+	## Velocity of the site with respect to the LSR, projected on the line of sight
+	vrot = 2*np.pi*np.hypot(O[...,0],O[...,1])[...,None]/86164.0905*east
+	vsun = lsrspeed*unit(*lsrapex)
+	vlsr = -np.sum((v+vrot)*d,-1)-(d2k@vsun)
+
+	ms = (tms-tms.astype('datetime64[s]')).astype('timedelta64[ms]').astype(int)
+	utc = ['%s.%03i'%(t.replace('-',' ').replace('T',' ').replace(':',' '),m) for t,m in
+		zip(tms.astype('datetime64[s]').astype(str),ms)]
+	return pd.DataFrame({'shddist':shddist,'shdalt':shdalt,'targaz':targaz,'targzd':targzd,
+		'sunaz':sunaz,'sunzd':sunzd,'diffaz':diffaz,'vlsr':vlsr,'targha':targha,
+		'ra':ra/15,'dec':dec,'last':theta/15,'glon':glon/15,'glat':glat,'utc':utc})
+
+####################################################################################################
+## Twilight calendar computed from the solar ephemeris, in place of a USNO table
+#  Returns (dawn, dusk) UTC times as HHMM, each shaped (31 days, 12 months) like USNOarrays, so
+#  	they can be passed to twilightindex in place of a calendar path
+#  depression is the sun depression (deg): 6 civil, 12 nautical, 18 astronomical
+#  As in a USNO table computed for Time Zone 0, each UTC date holds the first morning & evening
+#  	crossing that falls in it. A date with no crossing (the evening time passing 0000 UTC, or
+#  	a sun that never reaches the depression) repeats the previous date, as the shipped
+#  	tables were hand-edited; days missing from the calendar (e.g. Feb 30) are -1
+#  Agrees with the shipped USNO tables to within a minute; the CTIO table was printed for
+#  	S30 10, not the ctio site latitude of S30 43
+
+def twilightcrossings(lat,lon,jd0,ndays,depression,sign):
+	# Time (jd) the sun crosses -depression, rising (sign -1) or setting (sign +1), for each
+	# 	local day starting at jd0 (UTC midnight), by iterating on the hour angle
+	jd = jd0+np.arange(ndays)+0.5-lon/360+sign*0.25
+	phi = np.radians(lat)
+	for i in range(5):
+		ra,dec,R = sunposition(jd)
+		dec = np.radians(dec)
+		cosH = (np.sin(np.radians(-depression))-np.sin(phi)*np.sin(dec))/(np.cos(phi)*np.cos(dec))
+		with np.errstate(invalid='ignore'):
+			H = sign*np.degrees(np.arccos(cosH))
+		ha = sidereal(jd,lon)-ra
+		jd = jd+((H-ha+180)%360-180)/360.9856
+	return jd
+
+def twilightcalc(lat,lon,year,depression=12.):
+	dates = np.arange(np.datetime64('%04i-01-01'%year),np.datetime64('%04i-01-01'%(year+1)))
+	jd0 = julian(dates.astype('datetime64[ms]'))
+	tms = np.full((31,12,2),-1,dtype=int)
+	for k,sign in enumerate([-1,1]):
+		# Crossings from the local days either side of the year, in time order
+		jd = twilightcrossings(lat,lon,jd0[0]-2,len(dates)+4,depression,sign)
+		# 	rounded to the minute before binning them by UTC date
+		jd = np.round((jd[np.isfinite(jd)]-jd0[0])*1440)
+		mins = np.arange(len(dates))*1440.
+		i = np.minimum(np.searchsorted(jd,mins),len(jd)-1)
+		mins = (jd[i]-mins).astype(int)
+		hhmm = np.where((mins >= 0) & (mins < 1440),mins//60*100+mins%60,-1)
+		# Repeat the previous date where there is no crossing
+		good = np.flatnonzero(hhmm >= 0)
+		if len(good) == 0:
+			raise ValueError('The sun never reaches %g deg below the horizon at %g, %g in %i'%(depression,lat,lon,year))
+		hhmm = hhmm[good[np.maximum(np.searchsorted(good,np.arange(len(hhmm)),side='right')-1,0)]]
+		d = (dates-dates.astype('M8[M]')).astype(int)
+		m = dates.astype('M8[M]').astype(int)%12
+		tms[d,m,k] = hhmm
+	return tms[:,:,0],tms[:,:,1]
+
+####################################################################################################
+## Compare geometry() with the Shadow executable
+#  Runs Shadow once over the interval, at the same pointing, and returns the largest difference
+#  	per column (relative for georel columns), with whether it is within geotol
+#  With pertime (the default for ha/dec), Shadow is run once per time with -utc instead, since
+#  	Shadow's own interval loop lets an ha/dec pointing drift by a little every step
+#  Only night rows (sun zd > 90) are compared
+
+def shdarg(flag,x):
+	# Shadow reads angles as three fields: [hr/dg] [mn] [sec]
+	return ['-'+flag,'%.9f'%x,'0','0']
+
+def geovalidate(loc,time,radec=None,hadec=None,azel=None,height=102.,shdpath='./Shadow/',pertime=None):
+	if isinstance(loc,str):
+		locargs = ['-wiyn' if loc == 'kpno' else '-'+loc]
+	else:
+		locargs = ['-lon']+str(loc[0]).split()+['-lat']+str(loc[1]).split()+['-alt']+str(loc[2]).split()
+	if isinstance(time,str):
+		tmargs = [['-utc']+time.split()]
+	elif pertime or (pertime is None and hadec is not None):
+		tmargs = [['-utc']+t.replace('-',' ').replace('T',' ').replace(':',' ').split()
+			for t in geotimes(time).astype('datetime64[s]').astype(str)]
+	else:
+		tmargs = [['-from']+time[0].split()+['-to']+time[1].split()+['-dt',str(time[2])]]
+	ptargs = []
+	if radec is not None:
+		ptargs = shdarg('ra',radec[0])+shdarg('dec',radec[1])
+	elif hadec is not None:
+		ptargs = shdarg('ha',hadec[0])+shdarg('dec',hadec[1])
+	elif azel is not None:
+		ptargs = shdarg('az',azel[0]%24)+shdarg('el',azel[1])
+	ref = shdbatch(''.join(subprocess.run(['./shadow']+locargs+tm+ptargs+['-height',str(height)],
+		cwd=shdpath,stdout=subprocess.PIPE,universal_newlines=True,check=True).stdout for tm in tmargs))
+	# Shadow's own times, since it may drop the end of an interval
+	tms = shd2dt64(ref.utc.tolist()).astype('datetime64[ms]')
+	new = geometry(loc,tms,radec=radec,hadec=hadec,azel=azel,height=height)
+
+	night = ref.sunzd.to_numpy() > 90
+	report = {}
+	for col,tol in geotol.items():
+		diff = new[col].to_numpy()-ref[col].to_numpy()
+		period = {'targaz':360,'sunaz':360,'ra':24,'last':24,'glon':24,'targha':24}.get(col)
+		if period:
+			diff = (diff+period/2)%period-period/2
+		# Shadow leaves the azimuth undefined at the zenith
+		if col == 'targaz':
+			diff = np.where(ref.targzd.to_numpy() < 0.1,0,diff)
+		# The Sun's azimuth & the target's hour angle are compared as arcs on the sky, as they are
+		# 	loosely defined near the nadir & the pole
+		if col in ('sunaz','diffaz'):
+			diff = diff*np.sin(np.radians(ref.sunzd.to_numpy()))
+		if col == 'targha':
+			diff = diff*np.cos(np.radians(ref.dec.to_numpy()))
+		if col in georel:
+			diff = diff/ref[col].to_numpy()
+		err = float(np.max(np.abs(diff[night]))) if night.any() else 0.
+		report[col] = {'max':err,'tol':tol,'ok':err <= tol}
+	return report
@@ -7,9 +7,9 @@
 ####################################################################################################
 # Author: Margaret Gallant
 # Written for Python v3.6
-# Dependencies: shadow.exe (Jeff Percival, UW-Mad), LYAO driver file (Susan Nossal, UW-Mad), 
+# Dependencies: lyao_parse.py, shadow.exe (Jeff Percival, UW-Mad), LYAO driver file (Susan Nossal, UW-Mad), 
 # 	LYAO_RT (James Bishop)
-# Outstanding Python Modules: datetime, pandas
+# Outstanding Python Modules: datetime, numpy, pandas
 # Last Updated: 06-01-2018
 ####################################################################################################
 # BEGIN CODE 
@@ -19,14 +19,19 @@
 import os, sys, subprocess
 from datetime import datetime
 from calendar import isleap
-import pandas as pd
-import re
+import numpy as np
+import re, hashlib
+# pandas is imported inside the functions that build DataFrames, so the twilight & RT input
+# 	helpers load without it
+from collections import OrderedDict
+from numbers import Number
+from lyao_parse import cachewrite
 
 ####################################################################################################
-## Run the Shadow Code, Parse the Output, and Returns Shadow DataFrame
+## Build the Shadow Code argument list
 #  Not dependent on LYAO driver
 
-def shadow(loc,time,radec=None,hadec=None,azel=None,shdpath='./Shadow/'):
+def shdargs(loc,time,radec=None,hadec=None,azel=None):
 	## run 'shadow.x86_64 -help' for more help
 	## Check for location inputs
 	#  Valid presets include: pbo, wiyn, or erau
@@ -48,81 +53,174 @@ def shadow(loc,time,radec=None,hadec=None,azel=None,shdpath='./Shadow/'):
 	#  Single time: time = "YYYY MM DD HH MM SS.SSS"
 	#  Interval time: time = (start_time, end_time, time_interval)
 	#    where time_interval is in integer minutes
-	if len(time) == 3:
+	if isinstance(time,str):
+		tmstr = "-utc %s"%(time)
+	elif len(time) == 3:
 		tmstr = "-from %s -to %s -dt %i"%(time[0],time[1],time[2])
 	elif len(time) == 1:
-		tmstr = "-utc %s"%(time)
+		tmstr = "-utc %s"%(time[0])
 	else:
 		tmstr = ""
 	
+	## Pointings are decimal hours (RA, HA, Az) and degrees (Dec, El), as Shadow reads them
+	#  Shadow reads each angle as three fields, "[hr/dg] [mn] [sec]"; a lone field would take
+	#  	the next flag as its minutes, so the minutes & seconds are passed as 0
 	## Check for RA/Dec
-	radecstr = "-ra %.3f -dec %.3f"%(radec[0],radec[1]) if radec != None else ""
+	radecstr = "-ra %.3f 0 0 -dec %.3f 0 0"%(radec[0],radec[1]) if radec != None else ""
 	
 	## Check for HA/Dec
-	hadecstr = "-ha %.3f -dec %.3f"%(hadec[0],hadec[1]) if hadec != None else ""
+	hadecstr = "-ha %.3f 0 0 -dec %.3f 0 0"%(hadec[0],hadec[1]) if hadec != None else ""
 	
 	## Check for Az/El
-	azelstr = "-az %.3f -el %.3f"%(azel[0],azel[1]) if azel != None else ""
-	
-	## Run Shadow Code
-	command = "%sshadow %s %s %s %s %s > %soutput.txt"%(shdpath,locstr,tmstr,radecstr,hadecstr,azelstr,shdpath)
-	print(command)
-	subprocess.run(args=[command], shell=True)
-	id = open(shdpath+"output.txt")
-	lines = id.readlines()
-	#line = id.read()
-	id.close()
+	#  Az is in hours east of north (6 = east), as Shadow reads -az
+	azelstr = "-az %.3f 0 0 -el %.3f 0 0"%(azel[0],azel[1]) if azel != None else ""
 	
-	df = pd.DataFrame()
-	for line in lines:
-		s = pd.Series(shdparser(line))
-		df = df.append(s,ignore_index=True)
-	return df
+	## Split into arguments as the shell would
+	return ("%s %s %s %s %s"%(locstr,tmstr,radecstr,hadecstr,azelstr)).split()
 
 ####################################################################################################
-## Parse the Shadow output
+## Run the Shadow Code, Parse the Output, and Returns Shadow DataFrame
+#  Shadow is launched directly and its output read through a pipe, so concurrent calls
+#  	never share a file
+#  Raises RuntimeError if Shadow exits with an error
 #  Not dependent on LYAO driver
 
-def shdparser(line):
+def shadow(loc,time,radec=None,hadec=None,azel=None,shdpath='./Shadow/'):
+	args = [shdpath+"shadow"]+shdargs(loc,time,radec,hadec,azel)
+	print(" ".join(args))
+	proc = subprocess.run(args=args,stdout=subprocess.PIPE,stderr=subprocess.PIPE,universal_newlines=True)
+	if proc.returncode != 0:
+		raise RuntimeError('Shadow exited with status %i: %s'%(proc.returncode,proc.stderr.strip()))
+	return shdbatch(proc.stdout)
+
+####################################################################################################
+## Stream the Shadow Code output: yields Shadow DataFrames of up to chunk rows as Shadow prints
+#  	them, so long -from/-to/-dt windows are parsed with bounded memory
+#  Stopping early (e.g. breaking out of the loop) stops Shadow
+#  Raises RuntimeError, as shadow() does, if Shadow exits with an error once its output is read;
+#  	the rows read after the last full chunk are not yielded then
+#  Not dependent on LYAO driver
+
+def shadowstream(loc,time,radec=None,hadec=None,azel=None,shdpath='./Shadow/',chunk=1000):
+	args = [shdpath+"shadow"]+shdargs(loc,time,radec,hadec,azel)
+	print(" ".join(args))
+	proc = subprocess.Popen(args=args,stdout=subprocess.PIPE,stderr=subprocess.PIPE,universal_newlines=True)
+	try:
+		lines = []
+		for line in proc.stdout:
+			lines.append(line)
+			if len(lines) == chunk:
+				yield shdbatch(''.join(lines))
+				lines = []
+		err = proc.stderr.read()
+		if proc.wait() != 0:
+			raise RuntimeError('Shadow exited with status %i: %s'%(proc.returncode,err.strip()))
+		if lines:
+			yield shdbatch(''.join(lines))
+	finally:
+		# Only still running if the consumer stopped early
+		proc.stdout.close()
+		proc.stderr.close()
+		if proc.poll() is None:
+			proc.kill()
+		proc.wait()
+
+####################################################################################################
+## Memoized Shadow Code: returns the same DataFrame as shadow() but only runs the executable
+#  once per unique geometry (location, time window, pointing)
+#  Results are kept in an in-process LRU of shdmaxsize entries, and pickled to cachedir
+#  	(if given) so that other processes and later sweeps can reuse them
+#  Only runs that produced rows are cached, so a failed or empty Shadow run is tried again
+#  Not dependent on LYAO driver
+
+shdmaxsize = 128
+_shdcache = OrderedDict()
 
-	# Convert three dictionary keys in dms to one dictionary key in deg
-	def convert2dec(dict,keys):
-		dms = [dict[keys[0]],dict[keys[1]],dict[keys[2]]]
-		del(dict[keys[0]],dict[keys[1]],dict[keys[2]])
-		return float(dms[0]) + float(dms[1])/60 + float(dms[2])/(60*60)
+def shdkey(loc,time,radec=None,hadec=None,azel=None):
+	# Normalize inputs into a hashable key; pointings are rounded as shadow() formats them
+	def norm(x):
+		if isinstance(x,Number):
+			return '%.3f'%x
+		if x is None or isinstance(x,str):
+			return x
+		return tuple(norm(i) for i in x)
+	return (norm(loc),norm(tuple(time)),norm(radec),norm(hadec),norm(azel))
+
+def shadowcached(loc,time,radec=None,hadec=None,azel=None,shdpath='./Shadow/',cachedir=None):
+	key = shdkey(loc,time,radec,hadec,azel)
 	
-	# Given a pattern, convert a string into a dictionary
-	def string_to_dict(string, pattern):
-		## string_to_dict Written by Dan H. on StackOverflow
-		## https://stackoverflow.com/questions/11844986/
-		## convert-or-unformat-a-string-to-variables-like-format-but-in-reverse-in-p
-		regex = re.sub(r'{(.+?)}', r'(?P<_\1>.+)', pattern)
-		matches = re.search(regex,string)
-		values = list(matches.groups())
-		keys = re.findall(r'{(.+?)}', pattern)
-		_dict = dict(zip(keys, values))
-		return _dict
+	## Check the in-process LRU
+	if key in _shdcache:
+		_shdcache.move_to_end(key)
+		return _shdcache[key].copy()
 	
-	# Shadow output pattern
-	pattern = 'ra/dec {ra_h}H {ra_m}M {ra_s}S {dec_d}D {dec_m}\' {dec_s}" shadow distance {shddist} km altitude {shdalt} km targ az {targaz} zd {targzd} sun az {sunaz} zd {sunzd} diff-az {diffaz} utc {utc} last {last_h}H {last_m}M {last_s}S vlsr {vlsr} km/s l/b {glon_h}H {glon_m}M {glon_s}S {glat_d}D {glat_m}\' {glat_s}" ha {targha}\n'
+	## Check the on-disk cache
+	fpath = None
+	if cachedir is not None:
+		fpath = os.path.join(cachedir,hashlib.sha1(repr(key).encode()).hexdigest()+'.pkl')
+	df = None
+	if fpath is not None and os.path.exists(fpath):
+		import pandas as pd
+		df = pd.read_pickle(fpath)
+		if len(df) == 0:
+			df = None # left by an older version that cached a failed run
+	if df is None:
+		df = shadow(loc,time,radec=radec,hadec=hadec,azel=azel,shdpath=shdpath)
+		if len(df) == 0:
+			return df
+		if fpath is not None:
+			cachewrite(fpath,df.to_pickle)
 	
-	# Convert shadow output into dictionary
-	d = string_to_dict(line,pattern)
+	## Store in the in-process LRU
+	_shdcache[key] = df
+	if len(_shdcache) > shdmaxsize:
+		_shdcache.popitem(last=False)
+	return df.copy()
+
+####################################################################################################
+## Parse the Shadow output
+#  Not dependent on LYAO driver
+
+# Shadow output pattern
+shdpattern = 'ra/dec {ra_h}H {ra_m}M {ra_s}S {dec_d}D {dec_m}\' {dec_s}" shadow distance {shddist} km altitude {shdalt} km targ az {targaz} zd {targzd} sun az {sunaz} zd {sunzd} diff-az {diffaz} utc {utc} last {last_h}H {last_m}M {last_s}S vlsr {vlsr} km/s l/b {glon_h}H {glon_m}M {glon_s}S {glat_d}D {glat_m}\' {glat_s}" ha {targha}'
+
+# Compile the pattern once: each {key} becomes a group, the utc group spans its six fields,
+# 	and runs of whitespace between fields may be any length
+shdkeys = re.findall(r'{(.+?)}', shdpattern)
+shdregex = re.compile(''.join(
+	r'(\S+(?: \S+){5})' if i%2 and part=='utc' else r'(\S+)' if i%2 else re.escape(part).replace(r'\ ',r'\s+')
+	for i,part in enumerate(re.split(r'{(.+?)}', shdpattern))))
+
+# Columns given in dms (or hms), converted to one column in deg (or hr)
+shddms = ['ra','dec','last','glon','glat']
+
+def shdbatch(text):
+	import pandas as pd
+	# Match every line of the Shadow output at once
+	rows = shdregex.findall(text)
+	cols = dict(zip(shdkeys, np.array(rows,dtype=str).reshape(-1,len(shdkeys)).T))
 	
-	# Convert some dictionary keys from dms to deg or hms to hr
-	d['ra'] = convert2dec(d,['ra_h','ra_m','ra_s'])
-	d['dec'] = convert2dec(d,['dec_d','dec_m','dec_s'])
-	d['last'] = convert2dec(d,['last_h','last_m','last_s'])
-	d['glon'] = convert2dec(d,['glon_h','glon_m','glon_s'])
-	d['glat'] = convert2dec(d,['glat_d','glat_m','glat_s'])
+	# Convert dms to deg or hms to hr, as whole columns
+	# The sign is printed on the first field only (e.g. -00D 30'), so it applies to all three
+	dms = {}
+	for key in shddms:
+		pfx = key+'_d' if key+'_d' in cols else key+'_h'
+		sfx = [pfx, key+'_m', key+'_s']
+		sign = np.where(np.char.startswith(cols[sfx[0]],'-'),-1.,1.)
+		dms[key] = sign*(np.abs(cols[sfx[0]].astype(float)) + cols[sfx[1]].astype(float)/60 + cols[sfx[2]].astype(float)/(60*60))
+		for k in sfx:
+			del(cols[k])
 	
 	# Convert strings to floats, except for the utc string
-	utc = d.pop('utc') # Put 'utc' in safe-keeping
-	shdw={}
-	for x in d.items():
-		shdw[x[0]]=float(x[1]) # Convert each item to a float
-	shdw['utc'] = utc # Put 'utc' back in dictionary
-	return shdw
+	utc = cols.pop('utc')
+	shdw = {key:col.astype(float) for key,col in cols.items()}
+	shdw.update(dms)
+	shdw['utc'] = utc.astype(object)
+	return pd.DataFrame(shdw)
+
+def shdparser(line):
+	# Parse a single line of Shadow output into a dictionary
+	return shdbatch(line).iloc[0].to_dict()
 	
 ####################################################################################################
 ## Convert Datetime objects into Shadow-friendly strings
@@ -135,7 +233,7 @@ def dt2shd(dt):
 # Create LYAO inputs_los.dat file from Shadow DataFrame
 # ****DEPENDENT ON LYAO DRIVER****
 
-def shd2los(shdwdf,fout):
+def shd2los(shdwdf,fout,fluorb=0.882,fluxc=1e9):
 	# Susan's WHAM driver (driver_WHAMSUSANZEN.dat) looks for four input columns:
 	# SZA, ZNTH, AZI, HSHAD
 	sza = shdwdf.sunzd.tolist()
@@ -146,11 +244,13 @@ def shd2los(shdwdf,fout):
 	
 	# The driver also looks for a header with five values:
 	# (# of rows), (line label), (resonance wavelength), (branching ratio), (solar line center flux)
+	# fluorb is the Ly-beta branching ratio of n=3; test_los reports the H-alpha one, ~1-fluorb
+	# 	(0.118 at the default), in the hab_los.dat header. Ha_int is linear in that H-alpha ratio
+	# 	& the flux, so runs at these defaults can be rescaled afterwards by the header values
+	# 	(see lyao_parse.losscaled & lyao_store.storeintensity)
 	n_rows = shdwdf.shape[0]
 	llbl = 2
 	waveln = 1025.72
-	fluorb = 0.882
-	fluxc = 1e9
 	
 	# Write LOS file
 	id = open(fout,'w')
@@ -160,11 +260,87 @@ def shd2los(shdwdf,fout):
 	id.close()
 	return None
 
+####################################################################################################
+## Plan LOS rows by shadow altitude instead of by time
+#  shdwdf is Shadow output at a fine cadence (e.g. -dt 1) over the observing window
+#  Targets are given as shdalts (km), or spaced dz km (or n points) across the window's range;
+#  	each target is hit by interpolating the geometry in time where the shadow altitude first
+#  	crosses it, so every row of the returned DataFrame lands on a target
+#  With nmax, a longer list of targets is thinned to nmax, evenly spread over the sorted list
+#  The returned DataFrame holds the loscols geometry (all that shd2los needs) and the utc of
+#  	the nearest fine row
+#  Not dependent on LYAO driver
+
+# Columns interpolated for each planned row, and those that wrap at +-180 deg
+loscols = ['sunzd','targzd','diffaz','shdalt','shddist','sunaz','targaz']
+loswrap = ['diffaz','sunaz','targaz']
+
+def losplan(shdwdf,shdalts=None,dz=None,n=None,nmax=None):
+	import pandas as pd
+	h = shdwdf.shdalt.to_numpy(dtype=float)
+	if shdalts is None:
+		lo,hi = h.min(),h.max()
+		shdalts = np.arange(lo,hi,dz) if dz is not None else np.linspace(lo,hi,n or len(h))
+	shdalts = np.sort(np.asarray(shdalts,dtype=float))
+	
+	## Thin to nmax targets, evenly spread over the sorted list
+	if nmax is not None and len(shdalts) > nmax:
+		shdalts = shdalts[np.round(np.linspace(0,len(shdalts)-1,nmax)).astype(int)]
+	
+	## First segment [i, i+1] whose shadow altitudes bracket each target
+	a,b = h[:-1,None],h[1:,None]
+	cross = ((a-shdalts) * (b-shdalts) <= 0) & (a != b)
+	found = cross.any(axis=0)
+	i = np.argmax(cross,axis=0)[found]
+	z = shdalts[found]
+	w = (z-h[i])/(h[i+1]-h[i])
+	
+	d = {}
+	for col in loscols:
+		x0,x1 = shdwdf[col].to_numpy(dtype=float)[i],shdwdf[col].to_numpy(dtype=float)[i+1]
+		if col in loswrap:
+			x1 = x0 + (x1-x0+180)%360-180
+		x = x0 + w*(x1-x0)
+		d[col] = (x+180)%360-180 if col in loswrap else x
+	d['shdalt'] = z
+	d['utc'] = shdwdf.utc.to_numpy()[np.where(w < 0.5,i,i+1)]
+	return pd.DataFrame(d)
+
+####################################################################################################
+## Shadow altitudes to add where a LOS profile is poorly resolved
+#  Where linear interpolation between a row's neighbours misses its Ha_int by more than tol
+#  	(relative), the midpoints of both neighbouring intervals are added, unless the interval
+#  	is already narrower than dzmin km
+#  With nmax, only the nmax new targets beside the rows missed by the most (in Ha_int, so the
+#  	rounding of a faint tail doesn't crowd out the bright low-altitude curvature) are kept
+#  Returns the sorted new targets (empty when the profile is resolved)
+#  Not dependent on LYAO driver
+
+def losrefine(shdalt,Ha_int,tol=0.01,dzmin=2.,nmax=None):
+	z,I = np.asarray(shdalt,dtype=float),np.asarray(Ha_int,dtype=float)
+	order = np.argsort(z)
+	z,I = z[order],I[order]
+	if len(z) < 3:
+		return np.array([])
+	w = (z[1:-1]-z[:-2])/(z[2:]-z[:-2])
+	miss = np.abs(I[1:-1]-((1-w)*I[:-2]+w*I[2:]))
+	with np.errstate(divide='ignore',invalid='ignore'):
+		err = miss/np.abs(I[1:-1])
+	bad = np.flatnonzero(err > tol)+1
+	new = {}
+	for m in bad:
+		for j,k in [(m-1,m),(m,m+1)]:
+			if z[k]-z[j] > dzmin:
+				new[(z[j]+z[k])/2] = max(new.get((z[j]+z[k])/2,0.),miss[m-1])
+	mids = sorted(new,key=new.get,reverse=True)[:nmax]
+	return np.sort(np.array(mids,dtype=float))
+
 ####################################################################################################
 ## Parse USNO Calendar and output USNO DataFrame
 #  Not dependent on LYAO driver
 
 def USNOparser(fpath):
+	import pandas as pd
 	id = open(fpath)
 	lines = id.readlines()
 	id.close()
@@ -174,11 +350,8 @@ def USNOparser(fpath):
 	dates = [line[:2] for line in lines[9:-3]]
 
 	dcln = [line[2:-1] for line in lines[9:-3]]
-	d = [[line[i:i+11] for i in range(0,len(line),11)] for line in dcln]
-	usnodf=pd.DataFrame()
-	for i,row in enumerate(d):
-		s=pd.Series([item.split() for item in row])
-		usnodf = usnodf.append(s,ignore_index=True)
+	d = [[line[i:i+11].split() for i in range(0,len(line),11)] for line in dcln]
+	usnodf=pd.DataFrame(d)
 	usnodf.columns = months
 	usnodf.index = dates
 	usnodf.index.name = 'Day'
@@ -228,6 +401,117 @@ def dt2tod(dt,usnodf,UTCoffset,option='default'):
 	return [AM,PM,midnight]
 
 
+####################################################################################################
+## Read a USNO Calendar into integer arrays
+#  Returns (dawn, dusk), each shaped (31 days, 12 months) holding UTC times as HHMM
+#  Days missing from the calendar (e.g. Feb 30) are -1
+#  Not dependent on LYAO driver
+
+def USNOarrays(fpath):
+	id = open(fpath)
+	lines = id.readlines()
+	id.close()
+	
+	tms = np.full((31,12,2),-1,dtype=int)
+	for line in lines[9:-3]:
+		day = int(line[:2])
+		for mo in range(12):
+			item = line[2+11*mo:13+11*mo].split()
+			if len(item) == 2:
+				tms[day-1,mo] = [int(item[0]),int(item[1])]
+	return tms[:,:,0],tms[:,:,1]
+
+####################################################################################################
+## USNOparser-style DataFrame from (dawn, dusk) HHMM arrays, e.g. from LYAO_geometry.twilightcalc,
+#  	for use with dt2tod
+
+def USNOframe(dawn,dusk):
+	import pandas as pd
+	months = [datetime(2000,x+1,21).strftime('%b') for x in range(0,12)]
+	d = [[['%04i'%dawn[day,mo],'%04i'%dusk[day,mo]] if dawn[day,mo] >= 0 else [] for mo in range(12)] for day in range(31)]
+	usnodf=pd.DataFrame(d)
+	usnodf.columns = months
+	usnodf.index = ['%02i'%(x+1) for x in range(31)]
+	usnodf.index.name = 'Day'
+	return usnodf
+
+####################################################################################################
+## Compile the dt2tod time-of-day constraints for every day of a year at once
+#  Returns a dict of arrays: 'date' (datetime64[D]) and 'dawn', 'dusk', 'midnight' (datetime64[m]),
+#  	identical to calling dt2tod on each day, including the next-day & New Year rollover
+#  dst is a list of days of year on which UTCdst is used instead of UTCoffset
+#  fpath is a USNO calendar, or a (dawn, dusk) pair of HHMM arrays shaped like USNOarrays,
+#  	e.g. from LYAO_geometry.twilightcalc
+#  If cachedir is given, the index is saved there as an .npz per (calendar, year, offsets)
+#  Not dependent on LYAO driver
+
+def twilightindex(fpath,year,UTCoffset,dst=(),UTCdst=None,option='default',cachedir=None):
+	if isinstance(fpath,str):
+		name,calendar = os.path.basename(fpath).split('-')[0],open(fpath,'rb').read()
+	else:
+		name,calendar = 'calc',np.asarray(fpath,dtype=int).tobytes()
+	
+	## Check the on-disk cache
+	if cachedir is not None:
+		key = repr((calendar,year,UTCoffset,sorted(int(x) for x in dst),UTCdst,option))
+		cpath = os.path.join(cachedir,'%s-%i-%s.npz'%(name,year,
+			hashlib.sha1(key.encode()).hexdigest()[:12]))
+		if os.path.exists(cpath):
+			with np.load(cpath) as npz:
+				return {k:npz[k] for k in npz.files}
+	
+	## Day of year, day of month & month index for each date and the day after it
+	dates = np.arange(np.datetime64('%04i-01-01'%year),np.datetime64('%04i-01-01'%(year+1)))
+	doys = np.arange(1,len(dates)+1)
+	def dm(x):
+		return (x-x.astype('M8[M]')).astype(int), x.astype('M8[M]').astype(int)%12
+	
+	## UTC offset for each day
+	offset = np.where(np.isin(doys,dst),UTCdst if UTCdst is not None else UTCoffset,UTCoffset)
+	
+	## PM & same-day AM hours
+	if option=='ctio':
+		AMhr,AMmn = 9 + offset, np.zeros_like(offset) #9AM
+		PMhr,PMmn = 15 + offset, np.zeros_like(offset) #3PM
+	else:
+		dawn,dusk = USNOarrays(fpath) if isinstance(fpath,str) else fpath
+		d,m = dm(dates)
+		if (dawn[d,m] < 0).any() or (dusk[d,m] < 0).any():
+			raise ValueError('%s is missing times for %i'%(name,year))
+		PMhr,PMmn = dusk[d,m]//100, dusk[d,m]%100
+		AMhr = dawn[d,m]//100
+	
+	## AM falls on the next day when dusk is later in the UTC day than dawn
+	rollover = PMhr > AMhr
+	AMdates = dates + rollover.astype('m8[D]')
+	if option!='ctio':
+		d,m = dm(AMdates)
+		AMhr,AMmn = dawn[d,m]//100, dawn[d,m]%100
+	
+	hr,mn = np.timedelta64(1,'h'),np.timedelta64(1,'m')
+	index = {'date':dates,
+		'dawn':AMdates + AMhr*hr + AMmn*mn,
+		'dusk':dates + PMhr*hr + PMmn*mn,
+		'midnight':AMdates + offset*hr}
+	
+	if cachedir is not None:
+		os.makedirs(cachedir,exist_ok=True)
+		np.savez(cpath,**index)
+	return index
+
+####################################################################################################
+## Shadow-friendly strings for every day in a twilight index
+#  Returns arrays (dawn, dusk, midnight) matching the [AM, PM, midnight] output of dt2tod
+
+def twilightwindows(index):
+	def shdstr(x):
+		x = np.datetime_as_string(x.astype('M8[s]'))
+		for c in '-T:':
+			x = np.char.replace(x,c,' ')
+		return x
+	return shdstr(index['dawn']),shdstr(index['dusk']),shdstr(index['midnight'])
+
+
 ####################################################################################################
 ## Writes the RT inputs string
 #  Not dependent on LYAO driver
@@ -8,6 +8,9 @@ import numpy as np
 import pandas as pd
 import re
 from LYAO_inputsbuilder import *
+from LYAO_sweep import *
+from LYAO_queue import enqueue
+from LYAO_geometry import geosite, twilightcalc
 
 # Set-up Shadow Inputs
 yr,dst = 2000, np.linspace(93,303,303-93+1)
@@ -21,7 +24,7 @@ dates = [datetime.strptime("%i %i"%(yr,x),"%Y %j") for x in range(1,367)]
 path = os.path.abspath(os.path.dirname(sys.argv[0]))+"/"
 LYAOpath = path+'../LYAO_RT/'
 USNOpath = path+'../USNO/%s-%i-Nautical-Twilight-USNO.txt'%(observer.upper(),yr)
-USNOdf = USNOparser(USNOpath)
+USNOcache = path+'../USNO/cache/'
 savedir = path+'../PBO_finegrid/'
 
 # Set-up MSIS inputs
@@ -30,14 +33,58 @@ f107s = np.linspace(50,270,12)
 Aps=np.linspace(5,95,10)
 Ap=5
 
-run_count=0
+# Number of concurrent LYAO_RT runs (None uses every core)
+nworkers = None
 
-for date in dates:
-	doy = date.strftime("%-j")
-	UTCoffset = UTCdst if int(doy) in dst else UTCoffset
+# Geometry table from LYAO_ephemeris.buildephemeris() for this site & year (None runs Shadow)
+#  e.g. saveephemeris(buildephemeris(observer,yr,shdpath=path+'../Shadow/'),ephpath)
+ephpath = None
+
+# Consolidated store for the sweep results (see lyao_store.py)
+storedir = savedir+'store/'
+
+# Completion journal; rerunning this script skips runs already recorded as complete
+journal = savedir+'journal.jsonl'
+
+# Per-stage timings of every run; summarize with 'python LYAO_telemetry.py <file>'
+telemetry = savedir+'telemetry.jsonl'
+
+# test_rt results keyed by the RT inputs; runs with the same conditions only run test_los
+rtcache = savedir+'rt_cache/'
+
+# Run index for selecting saved runs (see lyao_parse.queryruns)
+indexdb = savedir+'runs.db'
+
+# Shared queue for multi-host sweeps (see LYAO_queue.py); when set, this script only enqueues
+#  the cases, and 'python LYAO_queue.py work <queuedb> ...' on each host runs them
+queuedb = None
+
+# Get dawn, dusk & midnight for every day of the year
+#  Without a USNO table for this site & year, the nautical twilight calendar is computed
+if not os.path.exists(USNOpath):
+	lat,lon,alt = geosite(observer)
+	USNOpath = twilightcalc(lat,lon,yr,depression=12.)
+twilight = twilightindex(USNOpath,yr,UTCoffset,dst=dst,UTCdst=UTCdst,cachedir=USNOcache)
+dawns,dusks,midnights = twilightwindows(twilight)
+
+# Adaptive mode: start from a coarse DOY x f107 x Ap grid and only add points where
+#  interpolating between neighbouring runs is off by more than tol, up to budget runs
+adaptive = False
+tol = 0.02
+budget = 2000
+Apgrid = [Ap] # e.g. Aps, to refine over Ap too
+
+# LOS rows placed by shadow altitude instead of every tm_int minutes (see LYAO_sweep.runinmemory)
+#  e.g. {'n':48,'refine':0.01,'levels':3} for 48 rows evenly spread in shadow altitude, refined
+#  	where Ha_int bends (mostly at low altitudes)
+#  A plan has at most nmax rows (default 144), and the store is made to hold that many
+losplan = None
+
+# Cases (AM & PM) for one day of year, f10.7 & Ap
+def makecases(doy,f107,Ap):
+	date,dawn,dusk,midnight = dates[doy-1],dawns[doy-1],dusks[doy-1],midnights[doy-1]
 		
 	# Get Shadow Time Intervals
-	dawn,dusk,midnight = dt2tod(date,USNOdf,UTCoffset)
 	tm_int = 10  # Interval in minutes
 	AMtime = [midnight,dawn,tm_int]
 	PMtime = [dusk,midnight,tm_int]
@@ -45,40 +92,28 @@ for date in dates:
 	# Calculate Time Of Day for AM & PM cases
 	tmdt = [date.replace(hour=tms[0]),date.replace(hour=tms[1])]
 	
-	for f107 in f107s:
-			for tm,dt,tmint in zip(["AM","PM"],tmdt,[AMtime,PMtime]):
-				print(tmint)
-
-				# Create Save Directory for Each Run
-				tmpath = savedir+"DOY_%s/f107_%i/%s"%(doy,f107,tm)
-				if not os.path.exists(tmpath):
-					os.makedirs(tmpath)
-
-				# Run Shadow Code
-				shdwdf = shadow(observer,tmint,shdpath=path+'../Shadow/')
-	
-				# Create LOS input file
-				shd2los(shdwdf,LYAOpath+'inputs_los.dat')
+	return [{'observer':observer,'doy':str(doy),'f107':f107,'Ap':Ap,'tm':tm,'tmint':tmint,'dt':dt,
+		'Apdir':len(Apgrid) > 1,'losplan':losplan} for tm,dt,tmint in zip(["AM","PM"],tmdt,[AMtime,PMtime])]
 
-				# Create a file prefix for save directory
-				fprfx = 'doy-%s_%s_f107-%i_'%(doy,tm,f107)
-		
-				#Save LOS inputs copy to AM & PM output directories
-				shutil.copyfile('%s/inputs_los.dat'%LYAOpath, '%s/%sinputs_los.dat'%(tmpath,fprfx))	
-
-				# Write RT input file
-				RT = RTinputstr(observer,dt,f107,Ap)
-				writeRTinput(LYAOpath,RT)
-				shutil.copyfile('%s/infile.dat'%LYAOpath, '%s/%sinfile.dat'%(tmpath,fprfx))
-				print("---- Begin Run: %s ----"%fprfx[:-1])
+# Build the list of cases
+doys = list(range(1,len(dates)+1))
+cases = [case for doy in doys for f107 in f107s for Ap in Apgrid for case in makecases(doy,f107,Ap)]
 
-				# Run LYAO_RT
-				subprocess.run(args=["./testscript"], shell=True, cwd=LYAOpath)
-
-				# Save output
-				shutil.copyfile("%s/H_alpha.source"%LYAOpath, "%s/%sH_alpha.source"%(tmpath,fprfx))
-				shutil.copyfile("%s/hab_los.dat"%LYAOpath, "%s/%shab_los.dat"%(tmpath,fprfx))
-	
-				run_count = run_count + 1
-				print("---- Run Saved to %s ----"%tmpath)
-				print("---- Number of Runs So Far: %i ----\n"%run_count)
+# Run LYAO_RT for every case, each worker in its own scratch directory
+if __name__ == '__main__':
+	if not os.path.exists(storedir+'axes.json'):
+		storecreate(storedir,doys,f107s,Apgrid,nlos=losplan.get('nmax',144) if losplan else 144)
+	options = dict(nworkers=nworkers,shdcache=savedir+'shadow_cache/',ephpath=ephpath,
+		storedir=storedir,journal=journal,telemetry=telemetry,rtcache=rtcache,indexdb=indexdb)
+	if queuedb is not None:
+		print("---- %i Runs Added to %s ----"%(enqueue(queuedb,cases,savedir),queuedb))
+	elif adaptive:
+		profiles = adaptivesweep(makecases,doys,f107s,Apgrid,savedir,LYAOpath,path+'../Shadow/',
+			tol=tol,budget=budget,**options)
+		print("---- %i Points Saved to %s ----"%(len(profiles),savedir))
+	else:
+		results = sweep(cases,savedir,LYAOpath,path+'../Shadow/',**options)
+		failed = [case for case,status in results if status != 0]
+		print("---- %i Runs Saved to %s, %i Failed ----"%(len(results)-len(failed),savedir,len(failed)))
+	if os.path.exists(telemetry):
+		telemetryprint(telemetrysummary(telemetryread(telemetry)))
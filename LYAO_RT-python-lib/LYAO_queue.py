@@ -0,0 +1,307 @@
+####################################################################################################
+# LYAO Queue
+# Contains functions for running a sweep from a work queue shared between hosts
+# The planner enqueues cases into a SQLite database on shared storage; any number of workers,
+# 	on any number of hosts, claim cases one at a time and run them with LYAO_sweep.runcase
+# 	in their own scratch directories, saving into the usual DOY_x/f107_y/AM|PM layout
+# A claimed case holds a lease that its worker renews while the run is going; a case whose
+# 	lease runs out (the worker crashed or lost its host) is claimed again by another worker
+# A finished case is published (telemetry, journal, store & run index) while its worker holds the
+# 	queue database's write lock and only if it still owns the case, so workers on different
+# 	hosts never write the shared files at the same time and a lost lease publishes nothing
+# SQLite locking needs a file system with working POSIX locks (local disk, NFSv4, Lustre);
+# 	avoid NFSv3 mounts without lockd
+####################################################################################################
+# Dependencies: LYAO_sweep.py, LYAO_telemetry.py, shadow.exe (Jeff Percival, UW-Mad), LYAO_RT (James Bishop)
+# Outstanding Python Modules: sqlite3, multiprocessing
+####################################################################################################
+# Usage:
+# 	python LYAO_queue.py work queue.db LYAOpath shdpath [--nworkers 8] [--rtcache dir]
+# 	python LYAO_queue.py status queue.db [--window 600]
+# 	python LYAO_queue.py requeue queue.db
+####################################################################################################
+# BEGIN CODE
+####################################################################################################
+
+### IMPORT MODULES ###
+import os, sys, json, time, socket, sqlite3, threading, argparse, shutil
+import multiprocessing as mp
+from datetime import datetime
+from LYAO_sweep import *
+
+## Queue settings: seconds a claim lasts without renewal, and claims per case before it fails
+qlease = 600
+qattempts = 3
+
+####################################################################################################
+## Queue database
+#  One row per case: state is 'queued', 'running', 'done' or 'failed'
+
+def queueconnect(dbpath):
+	# Autocommit connection; writes take the database lock with BEGIN IMMEDIATE
+	conn = sqlite3.connect(dbpath,timeout=60,isolation_level=None)
+	conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+		id INTEGER PRIMARY KEY, key TEXT UNIQUE, ckey TEXT, savedir TEXT, state TEXT, worker TEXT,
+		lease REAL, attempts INTEGER DEFAULT 0, status INTEGER, queued REAL, started REAL,
+		finished REAL, telemetry TEXT)''')
+	conn.execute('CREATE INDEX IF NOT EXISTS jobstate ON jobs (state, id)')
+	return conn
+
+def casedump(case):
+	case = dict(case)
+	case['dt'] = case['dt'].isoformat()
+	return json.dumps(case,sort_keys=True)
+
+def caseload(ckey):
+	case = json.loads(ckey)
+	case['dt'] = datetime.fromisoformat(case['dt'])
+	return case
+
+####################################################################################################
+## Planner: add cases to the queue
+#  Cases already in the queue are left as they are, so the planner can be rerun safely
+#  Returns the number of cases added
+
+def enqueue(dbpath,cases,savedir):
+	conn = queueconnect(dbpath)
+	now = time.time()
+	try:
+		conn.execute('BEGIN IMMEDIATE')
+		n = conn.total_changes
+		conn.executemany('INSERT OR IGNORE INTO jobs (key,ckey,savedir,state,queued) VALUES (?,?,?,?,?)',
+			[(casekey(case),casedump(case),savedir,'queued',now) for case in cases])
+		n = conn.total_changes-n
+		conn.execute('COMMIT')
+	finally:
+		conn.close()
+	return n
+
+####################################################################################################
+## Claim, renew & finish cases
+
+def claim(conn,worker,lease=qlease,attempts=qattempts):
+	# Claim the oldest queued case; returns (id, case, savedir) or None when nothing is left
+	now = time.time()
+	conn.execute('BEGIN IMMEDIATE')
+	try:
+		## Expired leases go back in the queue, or fail after too many attempts
+		conn.execute("UPDATE jobs SET state='failed', finished=? WHERE state='running' AND lease<? AND attempts>=?",(now,now,attempts))
+		conn.execute("UPDATE jobs SET state='queued', worker=NULL WHERE state='running' AND lease<?",(now,))
+		row = conn.execute("SELECT id,ckey,savedir FROM jobs WHERE state='queued' ORDER BY id LIMIT 1").fetchone()
+		if row is not None:
+			conn.execute("UPDATE jobs SET state='running', worker=?, lease=?, attempts=attempts+1, started=? WHERE id=?",
+				(worker,now+lease,now,row[0]))
+		conn.execute('COMMIT')
+	except Exception:
+		conn.execute('ROLLBACK')
+		raise
+	return None if row is None else (row[0],caseload(row[1]),row[2])
+
+def renew(conn,jobid,worker,lease=qlease):
+	# Extend a lease; False if the case was taken by another worker in the meantime
+	cur = conn.execute("UPDATE jobs SET lease=? WHERE id=? AND worker=? AND state='running'",(time.time()+lease,jobid,worker))
+	return cur.rowcount == 1
+
+def finish(conn,jobid,worker,status,records=()):
+	cur = conn.execute("UPDATE jobs SET state=?, status=?, finished=?, lease=NULL, telemetry=? WHERE id=? AND worker=? AND state='running'",
+		('done' if status == 0 else 'failed',status,time.time(),json.dumps(records),jobid,worker))
+	return cur.rowcount == 1
+
+def owns(conn,jobid,worker):
+	# True if worker still holds the case (its lease may have run out, but nobody has claimed it)
+	row = conn.execute("SELECT 1 FROM jobs WHERE id=? AND worker=? AND state='running'",(jobid,worker)).fetchone()
+	return row is not None
+
+def requeue(dbpath,state='failed'):
+	# Put failed (or stuck 'running') cases back in the queue
+	conn = queueconnect(dbpath)
+	try:
+		n = conn.execute("UPDATE jobs SET state='queued', worker=NULL, lease=NULL, attempts=0 WHERE state=?",(state,)).rowcount
+	finally:
+		conn.close()
+	return n
+
+####################################################################################################
+## Publish a finished case and mark it done or failed, in one queue transaction
+#  The BEGIN IMMEDIATE write lock serializes the shared writes of every worker on every host;
+#  	the store is opened afresh under the lock so no stale pages from another host are flushed
+#  Returns the status published (a run that can't be stored or indexed fails), or None, having
+#  	written nothing, if the case now belongs to another worker
+
+def publish(conn,jobid,worker,case,savedir,status,records,storedir=None,journal=None,
+		telemetry=None,indexdb=None):
+	conn.execute('BEGIN IMMEDIATE')
+	try:
+		owned = owns(conn,jobid,worker)
+		if owned:
+			## A run the store or index can't take fails its case, with the traceback recorded
+			try:
+				if storedir is not None and status == 0:
+					store = storeopen(storedir,mode='r+')
+					storeadd(store,savepath(savedir,case),case['doy'],case['f107'],case['Ap'],case['tm'])
+					del store
+				if indexdb is not None and status == 0:
+					index = indexopen(indexdb)
+					with index:
+						indexadd(index,savepath(savedir,case))
+					index.close()
+			except Exception:
+				status = 1
+				stageerror(records,'%s on %s'%(fileprefix(case)[:-1],worker),'Not Stored')
+			if telemetry is not None:
+				telemetrywrite(telemetry,casekey(case),status,records)
+			if journal is not None:
+				journalwrite(journal,case,status,savedir)
+			finish(conn,jobid,worker,status,records)
+		conn.execute('COMMIT')
+	except Exception:
+		conn.execute('ROLLBACK')
+		raise
+	return status if owned else None
+
+####################################################################################################
+## Worker: claim & run cases until the queue is empty
+#  The lease is renewed from a background thread every lease/3 seconds while a case runs
+#  Journal, telemetry, store & run index are the same options as LYAO_sweep.sweep
+#  A case that raises fails with its traceback printed and kept in its telemetry records
+
+def worker(dbpath,LYAOpath,shdpath,scratchroot=None,shdcache=None,ephpath=None,rtcache=None,
+		storedir=None,journal=None,telemetry=None,indexdb=None,lease=qlease,attempts=qattempts):
+	name = '%s:%i'%(socket.gethostname(),os.getpid())
+	conn = queueconnect(dbpath)
+	scratch = scratchdir(LYAOpath,shdpath,scratchroot)
+	eph = loadephemeris(ephpath) if ephpath is not None else None
+	nruns = 0
+	try:
+		while True:
+			job = claim(conn,name,lease,attempts)
+			if job is None:
+				break
+			jobid,case,savedir = job
+
+			## Keep the lease alive on a separate connection while the case runs
+			stop = threading.Event()
+			#  A renewal that fails (e.g. the database is locked while another worker publishes)
+			#  	is tried again on the next tick, well before the lease runs out
+			def heartbeat():
+				hconn = None
+				try:
+					while not stop.wait(lease/3.):
+						try:
+							hconn = hconn or queueconnect(dbpath)
+							renew(hconn,jobid,name,lease)
+						except sqlite3.Error as err:
+							print("---- %s: lease renewal for %s failed, retrying: %s ----"%(name,casekey(case),err))
+				finally:
+					if hconn is not None:
+						hconn.close()
+			beat = threading.Thread(target=heartbeat,daemon=True)
+			beat.start()
+			records = []
+			try:
+				status = runcase(case,scratch,savedir,shdcache,eph,records,rtcache)
+			except Exception:
+				status = 1
+				stageerror(records,'%s on %s'%(fileprefix(case)[:-1],name))
+			finally:
+				stop.set()
+				beat.join()
+
+			status = publish(conn,jobid,name,case,savedir,status,records,storedir,journal,telemetry,indexdb)
+			if status is None:
+				print("---- %s: lease on %s was lost, result left to the new owner ----"%(name,casekey(case)))
+			else:
+				print("---- %s Run %s%s: %s ----"%(name,fileprefix(case)[:-1],"" if status==0 else " FAILED",savepath(savedir,case)))
+			nruns = nruns + 1
+	finally:
+		conn.close()
+		shutil.rmtree(scratch,ignore_errors=True)
+	return nruns
+
+def workers(dbpath,LYAOpath,shdpath,nworkers=None,**kwargs):
+	# nworkers worker processes on this host (None uses every core)
+	nworkers = nworkers or os.cpu_count()
+	procs = [mp.Process(target=worker,args=(dbpath,LYAOpath,shdpath),kwargs=kwargs) for x in range(nworkers)]
+	for proc in procs:
+		proc.start()
+	for proc in procs:
+		proc.join()
+
+####################################################################################################
+## Queue status: cases per state, throughput over the last window seconds, per-host counts & ETA
+
+def queuestatus(dbpath,window=600):
+	conn = queueconnect(dbpath)
+	now = time.time()
+	try:
+		states = dict(conn.execute('SELECT state,COUNT(*) FROM jobs GROUP BY state').fetchall())
+		recent = conn.execute('SELECT COUNT(*),MIN(finished) FROM jobs WHERE finished>?',(now-window,)).fetchone()
+		first,last = conn.execute('SELECT MIN(started),MAX(finished) FROM jobs WHERE finished IS NOT NULL').fetchone()
+		hosts = conn.execute("SELECT worker,state,COUNT(*) FROM jobs WHERE worker IS NOT NULL GROUP BY worker,state").fetchall()
+		expired = conn.execute("SELECT COUNT(*) FROM jobs WHERE state='running' AND lease<?",(now,)).fetchone()[0]
+	finally:
+		conn.close()
+
+	report = {'states':{state:states.get(state,0) for state in ['queued','running','done','failed']},
+		'expired':expired,'hosts':{}}
+	for name,state,n in hosts:
+		host = name.rsplit(':',1)[0]
+		report['hosts'].setdefault(host,{}).setdefault(state,0)
+		report['hosts'][host][state] += n
+	report['runs_per_s'] = recent[0]/float(window) if recent[0] else 0.
+	if first is not None and last > first:
+		report['runs_per_s_total'] = (report['states']['done']+report['states']['failed'])/(last-first)
+	left = report['states']['queued']+report['states']['running']
+	if report['runs_per_s'] > 0:
+		report['eta_s'] = left/report['runs_per_s']
+	return report
+
+def statusprint(report,window=600):
+	s = report['states']
+	print('---- %i Queued, %i Running (%i Lease Expired), %i Done, %i Failed ----'%(s['queued'],s['running'],
+		report['expired'],s['done'],s['failed']))
+	for host,states in sorted(report['hosts'].items()):
+		print('%-30s %s'%(host,' '.join('%s %i'%x for x in sorted(states.items()))))
+	print('---- Throughput: %.2f runs/s over the last %i s ----'%(report['runs_per_s'],window))
+	if 'runs_per_s_total' in report:
+		print('---- Throughput: %.2f runs/s overall ----'%report['runs_per_s_total'])
+	if 'eta_s' in report:
+		print('---- ETA: %.1f hours ----'%(report['eta_s']/3600))
+
+####################################################################################################
+## Command line
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Run LYAO_RT cases from a shared SQLite queue')
+	sub = parser.add_subparsers(dest='cmd')
+	work = sub.add_parser('work',help='claim and run cases until the queue is empty')
+	work.add_argument('dbpath')
+	work.add_argument('LYAOpath')
+	work.add_argument('shdpath')
+	work.add_argument('--nworkers',type=int,default=None)
+	work.add_argument('--scratchroot',default=None,help='where scratch directories are made (local disk)')
+	work.add_argument('--shdcache',default=None)
+	work.add_argument('--ephpath',default=None)
+	work.add_argument('--rtcache',default=None)
+	work.add_argument('--storedir',default=None)
+	work.add_argument('--journal',default=None)
+	work.add_argument('--telemetry',default=None)
+	work.add_argument('--indexdb',default=None)
+	work.add_argument('--lease',type=float,default=qlease)
+	status = sub.add_parser('status',help='report queue progress and throughput')
+	status.add_argument('dbpath')
+	status.add_argument('--window',type=float,default=600,help='seconds of recent runs used for throughput')
+	again = sub.add_parser('requeue',help='put failed cases back in the queue')
+	again.add_argument('dbpath')
+	args = parser.parse_args()
+
+	if args.cmd == 'work':
+		workers(args.dbpath,args.LYAOpath,args.shdpath,nworkers=args.nworkers,scratchroot=args.scratchroot,
+			shdcache=args.shdcache,ephpath=args.ephpath,rtcache=args.rtcache,storedir=args.storedir,
+			journal=args.journal,telemetry=args.telemetry,indexdb=args.indexdb,lease=args.lease)
+	elif args.cmd == 'status':
+		statusprint(queuestatus(args.dbpath,args.window),args.window)
+	elif args.cmd == 'requeue':
+		print('---- %i Cases Requeued ----'%requeue(args.dbpath))
+	else:
+		parser.print_help()
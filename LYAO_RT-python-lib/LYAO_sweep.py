@@ -0,0 +1,556 @@
+####################################################################################################
+# LYAO Sweep
+# Contains functions for running many LYAO_RT cases concurrently on a process pool
+# Each worker runs inside its own scratch directory, a symlink farm of the LYAO_RT
+# 	and Shadow executables, so the fixed filenames (infile.dat, inputs_los.dat,
+# 	H_alpha.source, hab_los.dat) never collide between workers
+# Outputs are collected into the usual DOY_x/f107_y/AM|PM save layout, and optionally
+# 	into a consolidated lyao_store as runs finish
+# H_alpha.source depends only on infile.dat, so test_rt results can be kept in a cache
+# 	keyed by the RT inputs; runs that share RT inputs (e.g. other pointings) only run test_los
+# Scratch directories are made in tmpfs (/dev/shm) when it is available; the RT inputs are
+# 	piped to test_rt, and finished files are moved (not copied) into the save tree
+####################################################################################################
+# Dependencies: LYAO_inputsbuilder.py, LYAO_ephemeris.py, lyao_store.py, LYAO_telemetry.py, shadow.exe (Jeff Percival, UW-Mad), LYAO_RT (James Bishop)
+# Outstanding Python Modules: multiprocessing
+####################################################################################################
+# BEGIN CODE
+####################################################################################################
+
+### IMPORT MODULES ###
+import os, shutil, subprocess, tempfile, json, hashlib, time, itertools
+import multiprocessing as mp
+import numpy as np
+from LYAO_inputsbuilder import *
+from LYAO_ephemeris import *
+from lyao_store import *
+from lyao_parse import Los, indexopen, indexadd, runhandle, parsecached, cachewrite, losscaled
+from LYAO_telemetry import *
+
+## Executables linked into each scratch directory
+LYAOexes = ['test_rt','test_los','testscript']
+SHDexes = ['shadow']
+
+## Memory-backed file system for scratch directories, used when it exists and is writable
+scratchtmpfs = '/dev/shm'
+
+## Files written by a single LYAO_RT run
+LYAOinputs = ['inputs_los.dat','infile.dat']
+LYAOoutputs = ['H_alpha.source','hab_los.dat']
+
+####################################################################################################
+## Build a scratch directory holding symlinks to the LYAO_RT and Shadow executables
+#  Returns the scratch root; LYAO_RT lives in <root>/LYAO_RT/ and Shadow in <root>/Shadow/
+#  Without a root, scratch goes in scratchtmpfs if possible, otherwise the system temp directory
+
+def scratchbase(root=None):
+	if root is None and os.path.isdir(scratchtmpfs) and os.access(scratchtmpfs,os.W_OK):
+		return scratchtmpfs
+	return root
+
+def scratchdir(LYAOpath,shdpath,root=None):
+	root = scratchbase(root)
+	scratch = tempfile.mkdtemp(prefix='lyao_',dir=root)
+	for sub,src,exes in [('LYAO_RT',LYAOpath,LYAOexes),('Shadow',shdpath,SHDexes)]:
+		os.makedirs(os.path.join(scratch,sub))
+		for exe in exes:
+			os.symlink(os.path.abspath(os.path.join(src,exe)),os.path.join(scratch,sub,exe))
+	return scratch
+
+####################################################################################################
+## Naming conventions for a single case
+#  A case is a dict with keys: observer, doy, f107, Ap, tm ("AM"/"PM"),
+#  	tmint (shadow time tuple), dt (datetime used for the RT input)
+#  	and optionally Apdir (True to save under an extra Ap_z level, for sweeps over Ap)
+#  	and losplan (LOS rows placed by shadow altitude, see runinmemory)
+
+def savepath(savedir,case):
+	if case.get('Apdir'):
+		return os.path.join(savedir,"DOY_%s/f107_%i/Ap_%i/%s"%(case['doy'],case['f107'],case['Ap'],case['tm']))
+	return os.path.join(savedir,"DOY_%s/f107_%i/%s"%(case['doy'],case['f107'],case['tm']))
+
+def fileprefix(case):
+	return 'doy-%s_%s_f107-%i_'%(case['doy'],case['tm'],case['f107'])
+
+####################################################################################################
+## LYAO_RT stages
+#  test_rt reads the infile.dat lines on stdin (piped from RTinputstr) and writes H_alpha.source;
+#  	test_los reads inputs_los.dat and H_alpha.source and writes hab_los.dat
+#  With rtcache, each H_alpha.source is saved as <RT input hash>.source and later runs with the
+#  	same RT inputs copy it back instead of running test_rt
+
+def rtcachepath(rtcache,RT):
+	return os.path.join(rtcache,hashlib.sha1(''.join(RT).encode()).hexdigest()+'.source')
+
+def runrt(LYAOpath,RT,rtcache=None,rec=None):
+	rec = {} if rec is None else rec
+	fout = LYAOpath+'H_alpha.source'
+	cpath = rtcachepath(rtcache,RT) if rtcache is not None else None
+	if cpath is not None and os.path.exists(cpath):
+		shutil.copyfile(cpath,fout)
+		rec['cached'] = True
+		return 0
+	proc = subprocess.run(args=["./test_rt"],cwd=LYAOpath,input=''.join(RT),universal_newlines=True,
+		stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+	if cpath is not None and proc.returncode == 0 and os.path.exists(fout):
+		with open(fout,'rb') as src:
+			cachewrite(cpath,lambda id: shutil.copyfileobj(src,id))
+	rec['cached'] = False
+	return proc.returncode
+
+def runlos(LYAOpath):
+	proc = subprocess.run(args=["./test_los"],cwd=LYAOpath,stdin=subprocess.DEVNULL,
+		stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+	return proc.returncode
+
+####################################################################################################
+## Run one case inside a scratch directory
+#  Returns (exit status, run); a run that leaves no output counts as failed
+#  With parse, run is an LYAO_RT with every file already parsed into memory, else None
+#  With savedir, the inputs & outputs are moved into the save tree; otherwise they stay in
+#  	scratch until the next case
+#  Each stage is timed and appended to records (see LYAO_telemetry.stage)
+#  If the case has a losplan dict, LOS rows are placed by shadow altitude (see losplan) from
+#  	geometry at a dt-minute cadence (default 1) instead of one row per tmint step:
+#  	shdalts (km), or dz (km spacing), or n (number of rows) across the window
+#  	With refine (tol), test_los is run again with rows added where the Ha_int profile is
+#  	poorly resolved (see losrefine), up to levels times (default 2), dzmin km (default 2)
+#  	and nmax rows in all (default 144, the lyao_store LOS length); each level adds the rows
+#  	beside the worst-resolved ones that still fit
+#  	The initial plan is thinned to nmax rows, or nmax/2 with refine to leave room for it
+
+def runinmemory(case,scratch,savedir=None,shdcache=None,eph=None,records=None,rtcache=None,parse=True):
+	LYAOpath = os.path.join(scratch,'LYAO_RT/')
+	shdpath = os.path.join(scratch,'Shadow/')
+	records = [] if records is None else records
+
+	# Remove the previous run's outputs so a failed run can't look like a finished one
+	for fn in LYAOoutputs:
+		if os.path.exists(LYAOpath+fn):
+			os.remove(LYAOpath+fn)
+
+	# Look up the geometry table, or run Shadow Code (once per unique geometry)
+	#  Windows the table doesn't cover fall back to Shadow
+	plan = case.get('losplan')
+	tmint = case['tmint'] if plan is None else list(case['tmint'][:2])+[plan.get('dt',1)]
+	with stage(records,'shadow') as rec:
+		shdwdf = None
+		if eph is not None:
+			try:
+				shdwdf = ephlookup(eph,tmint)
+			except ValueError as err:
+				rec['fallback'] = str(err)
+		if shdwdf is None:
+			shdwdf = shadowcached(case['observer'],tmint,shdpath=shdpath,cachedir=shdcache)
+		rec['rows'] = len(shdwdf)
+	if len(shdwdf) == 0:
+		return 1,None
+
+	# Create LOS input file
+	with stage(records,'shd2los') as rec:
+		nmax = None if plan is None else plan.get('nmax',144)
+		if plan is not None and plan.get('refine'):
+			nmax = nmax//2
+		losdf = shdwdf if plan is None else losplan(shdwdf,plan.get('shdalts'),plan.get('dz'),plan.get('n'),nmax)
+		shd2los(losdf,LYAOpath+'inputs_los.dat')
+		rec['bytes'] = os.path.getsize(LYAOpath+'inputs_los.dat')
+
+	# RT inputs, piped to test_rt; infile.dat is only kept as a record of the run
+	with stage(records,'writeRTinput') as rec:
+		RT = RTinputstr(case['observer'],case['dt'],case['f107'],case['Ap'])
+		writeRTinput(LYAOpath,RT)
+		rec['bytes'] = os.path.getsize(LYAOpath+'infile.dat')
+
+	# Run LYAO_RT: the two steps of testscript, timed separately
+	status = 0
+	for exe,fout,run in [('test_rt','H_alpha.source',lambda rec: runrt(LYAOpath,RT,rtcache,rec)),
+			('test_los','hab_los.dat',lambda rec: runlos(LYAOpath))]:
+		with stage(records,exe) as rec:
+			rec['status'] = run(rec)
+			rec['bytes'] = os.path.getsize(LYAOpath+fout) if os.path.exists(LYAOpath+fout) else 0
+		status = status or rec['status']
+
+	# Add LOS rows where the profile is poorly resolved, and run test_los again
+	#  hab_los.dat has one row per inputs_los.dat row, in the same shadow altitude order
+	if plan is not None and plan.get('refine') and status == 0 and os.path.exists(LYAOpath+'hab_los.dat'):
+		for level in range(plan.get('levels',2)):
+			targets = np.sort(losdf.shdalt.to_numpy())
+			los = Los(LYAOpath+'hab_los.dat')
+			if len(los.Ha_int) != len(targets):
+				break
+			room = plan.get('nmax',144)-len(targets)
+			new = losrefine(targets,los.Ha_int,plan['refine'],plan.get('dzmin',2.),room) if room > 0 else []
+			if len(new) == 0:
+				break
+			with stage(records,'test_los') as rec:
+				losdf = losplan(shdwdf,np.concatenate([targets,new]))
+				shd2los(losdf,LYAOpath+'inputs_los.dat')
+				rec['refine'] = level+1
+				rec['status'] = runlos(LYAOpath)
+				rec['bytes'] = os.path.getsize(LYAOpath+'hab_los.dat') if os.path.exists(LYAOpath+'hab_los.dat') else 0
+			status = status or rec['status']
+			if status:
+				break
+	if not all(os.path.exists(LYAOpath+fn) for fn in LYAOoutputs):
+		status = status or 1
+
+	# Parse the outputs while they are in scratch
+	run = None
+	if parse and status == 0:
+		with stage(records,'parse') as rec:
+			run = runhandle([LYAOpath+fn for fn in ['infile.dat','H_alpha.source','hab_los.dat']])
+			for part in ('inf','src','los'):
+				setattr(run,part,parsecached(getattr(run,part)))
+
+	# Move inputs & outputs into the save tree
+	if savedir is not None:
+		with stage(records,'save') as rec:
+			tmpath = savepath(savedir,case)
+			if not os.path.exists(tmpath):
+				os.makedirs(tmpath,exist_ok=True)
+			fprfx = fileprefix(case)
+			rec['bytes'] = 0
+			for fn in LYAOinputs+LYAOoutputs:
+				if os.path.exists(LYAOpath+fn):
+					rec['bytes'] += os.path.getsize(LYAOpath+fn)
+					shutil.move(LYAOpath+fn,os.path.join(tmpath,fprfx+fn))
+				elif os.path.exists(os.path.join(tmpath,fprfx+fn)):
+					# Don't leave an earlier run's output next to this run's inputs
+					os.remove(os.path.join(tmpath,fprfx+fn))
+	return status,run
+
+####################################################################################################
+## Run one case inside a scratch directory and save its inputs & outputs
+#  Returns the exit status
+
+def runcase(case,scratch,savedir,shdcache=None,eph=None,records=None,rtcache=None):
+	return runinmemory(case,scratch,savedir,shdcache,eph,records,rtcache,parse=False)[0]
+
+####################################################################################################
+## Check that Ha_int scales linearly with the line center flux & branching ratio
+#  Runs the case once at the shd2los defaults, then reruns test_los on the same H_alpha.source
+#  	for each (fluorb, fluxc) in variants, and compares each result with the reference run
+#  	rescaled by lyao_parse.losscaled to the branching ratio & flux test_los reports
+#  Returns {(fluorb, fluxc): largest relative difference}, and whether all are within tol
+
+def checklinearity(case,scratch,variants=((0.882,5e8),(0.882,2e9),(0.85,1e9),(0.9,3e9)),tol=0.01,**kwargs):
+	LYAOpath = os.path.join(scratch,'LYAO_RT/')
+	status,ref = runinmemory(case,scratch,**kwargs)
+	if status != 0:
+		raise RuntimeError('Reference run of %s failed with status %i'%(casekey(case),status))
+	lines = open(LYAOpath+'inputs_los.dat').readlines()
+	header = lines[0].split('\t')
+
+	report = {}
+	for fluorb,fluxc in variants:
+		with open(LYAOpath+'inputs_los.dat','w') as id:
+			id.write('\t'.join(header[:3]+['%.3e'%fluorb,'%.4e\n'%fluxc]))
+			id.writelines(lines[1:])
+		if runlos(LYAOpath) != 0:
+			raise RuntimeError('test_los failed for fluorb %g, fluxc %g'%(fluorb,fluxc))
+		los = parsecached(Los(LYAOpath+'hab_los.dat'))
+		pred = losscaled(ref.los,los.flux,los.branch)
+		good = np.abs(pred) > 0
+		report[(fluorb,fluxc)] = float(np.max(np.abs(los.Ha_int[good]-pred[good])/np.abs(pred[good])))
+	return report,all(err <= tol for err in report.values())
+
+####################################################################################################
+## Finite-difference sensitivity of Ha_int to RT inputs (f10.7, Ap)
+#  rtconfig is the base set of RTinputstr arguments, e.g. {'loc':'pbo','time':dt,'f107':70,'Ap':5}
+#  steps gives the parameters to perturb and their step, e.g. {'f107':5.,'Ap':2.}; RTinputstr
+#  	writes both to 0.1, so steps should be multiples of 0.1 (f107 sets the daily & 81-day values)
+#  Shadow (or the eph table) runs once for tmint and every run shares that one inputs_los.dat;
+#  	only the perturbed infiles differ. Runs go on a pool of nworkers, with rtcache as in runrt
+#  With central, each parameter is run at -step & +step, otherwise at the base & +step
+#  Returns a dict: shdalt & Ha_int of the base run, params, and J shaped (params, LOS rows) with
+#  	dHa_int/dparam on the base run's shdalt (perturbed profiles are interpolated onto it)
+
+_sens = {}
+
+def _initsens(scratchq,losfile,rtcache):
+	_sens['scratch'] = scratchq.get()
+	_sens['rtcache'] = rtcache
+	LYAOpath = os.path.join(_sens['scratch'],'LYAO_RT/')
+	os.symlink(losfile,LYAOpath+'inputs_los.dat')
+
+def _runsens(RT):
+	LYAOpath = os.path.join(_sens['scratch'],'LYAO_RT/')
+	for fn in LYAOoutputs:
+		if os.path.exists(LYAOpath+fn):
+			os.remove(LYAOpath+fn)
+	status = runrt(LYAOpath,RT,_sens['rtcache']) or runlos(LYAOpath)
+	if status != 0 or not os.path.exists(LYAOpath+'hab_los.dat'):
+		return None
+	los = parsecached(Los(LYAOpath+'hab_los.dat'))
+	return los.shdalt,los.Ha_int
+
+def sensitivity(rtconfig,tmint,steps,LYAOpath,shdpath,central=True,nworkers=None,scratchroot=None,
+		shdcache=None,ephpath=None,rtcache=None):
+	## One geometry & one inputs_los.dat for every run
+	tmp = tempfile.mkdtemp(prefix='lyao_sens_',dir=scratchbase(scratchroot))
+	try:
+		if ephpath is not None:
+			shdwdf = ephlookup(loadephemeris(ephpath),tmint)
+		else:
+			shdscratch = scratchdir(LYAOpath,shdpath,tmp)
+			shdwdf = shadowcached(rtconfig['loc'],tmint,shdpath=os.path.join(shdscratch,'Shadow/'),cachedir=shdcache)
+		losfile = os.path.join(tmp,'inputs_los.dat')
+		shd2los(shdwdf,losfile)
+
+		## Base run, then the perturbed runs
+		params = list(steps)
+		configs = [dict(rtconfig)]
+		for p in params:
+			for sign in ([-1,1] if central else [1]):
+				configs.append(dict(rtconfig,**{p:rtconfig[p]+sign*steps[p]}))
+		RTs = [RTinputstr(**config) for config in configs]
+
+		nworkers = max(1,min(nworkers or os.cpu_count(),len(RTs)))
+		scratchq = mp.Queue()
+		for x in range(nworkers):
+			scratchq.put(scratchdir(LYAOpath,shdpath,tmp))
+		with mp.Pool(nworkers,initializer=_initsens,initargs=(scratchq,losfile,rtcache)) as pool:
+			profiles = pool.map(_runsens,RTs)
+	finally:
+		shutil.rmtree(tmp,ignore_errors=True)
+
+	failed = [config for config,prof in zip(configs,profiles) if prof is None]
+	if failed:
+		raise RuntimeError('%i sensitivity runs failed, e.g. %s'%(len(failed),failed[0]))
+
+	## Central or forward differences on the base run's shadow altitudes
+	shdalt,Ha_int = profiles[0]
+	def onbase(prof):
+		return np.interp(shdalt,prof[0],prof[1],left=np.nan,right=np.nan)
+	J = np.empty((len(params),len(shdalt)))
+	for k,p in enumerate(params):
+		if central:
+			J[k] = (onbase(profiles[1+2*k+1])-onbase(profiles[1+2*k]))/(2*steps[p])
+		else:
+			J[k] = (onbase(profiles[1+k])-Ha_int)/steps[p]
+	return {'shdalt':shdalt,'Ha_int':Ha_int,'params':params,'J':J,'steps':dict(steps),'central':central}
+
+####################################################################################################
+## Completion journal
+#  An append-only JSON-lines file with one entry per finished run: the case key, the RT input
+#  	and geometry hashes, checksums of the saved files and the exit status. The last entry for
+#  	a key wins.
+#  A case counts as done when its last entry succeeded, its RT inputs and geometry (site, time
+#  	window & losplan) are unchanged and every saved file still matches its checksum; any other
+#  	case is run again
+
+def casekey(case):
+	return '%s|%s|%.1f|%.1f|%s'%(case['observer'],case['doy'],case['f107'],case['Ap'],case['tm'])
+
+def filehash(fpath):
+	with open(fpath,'rb') as id:
+		return hashlib.sha1(id.read()).hexdigest()
+
+def RThash(case):
+	RT = RTinputstr(case['observer'],case['dt'],case['f107'],case['Ap'])
+	return hashlib.sha1(''.join(RT).encode()).hexdigest()
+
+def geomhash(case):
+	geom = {'observer':case['observer'],'tmint':case['tmint'],'losplan':case.get('losplan')}
+	return hashlib.sha1(json.dumps(geom,sort_keys=True,default=lambda x: np.asarray(x).tolist()).encode()).hexdigest()
+
+def journalread(fpath):
+	entries = {}
+	if os.path.exists(fpath):
+		with open(fpath) as id:
+			for line in id:
+				try:
+					entry = json.loads(line)
+				except ValueError:
+					continue # partial line from a sweep that died mid-write
+				entries[entry['key']] = entry
+	return entries
+
+def journalwrite(fpath,case,status,savedir):
+	tmpath,fprfx = savepath(savedir,case),fileprefix(case)
+	files = {}
+	for fn in LYAOinputs+LYAOoutputs:
+		if os.path.exists(os.path.join(tmpath,fprfx+fn)):
+			files[fn] = filehash(os.path.join(tmpath,fprfx+fn))
+	entry = {'key':casekey(case),'RT':RThash(case),'geom':geomhash(case),'files':files,'status':status,'time':time.time()}
+	with open(fpath,'a') as id:
+		id.write(json.dumps(entry)+'\n')
+		id.flush()
+		os.fsync(id.fileno())
+	return entry
+
+def casedone(case,entries,savedir):
+	entry = entries.get(casekey(case))
+	if entry is None or entry['status'] != 0 or entry['RT'] != RThash(case) or entry.get('geom') != geomhash(case):
+		return False
+	tmpath,fprfx = savepath(savedir,case),fileprefix(case)
+	for fn in LYAOinputs+LYAOoutputs:
+		fpath = os.path.join(tmpath,fprfx+fn)
+		if fn not in entry['files'] or not os.path.exists(fpath) or filehash(fpath) != entry['files'][fn]:
+			return False
+	return True
+
+####################################################################################################
+## Process pool workers
+#  Each worker claims one scratch directory from the queue when it starts
+
+_worker = {}
+
+def _initworker(scratchq,savedir,shdcache,ephpath,rtcache):
+	_worker['scratch'] = scratchq.get()
+	_worker['savedir'] = savedir
+	_worker['shdcache'] = shdcache
+	_worker['rtcache'] = rtcache
+	_worker['eph'] = loadephemeris(ephpath) if ephpath is not None else None
+
+def _runcase(case):
+	# An error in one case (e.g. Shadow failing) fails that case, not the sweep
+	records = []
+	try:
+		status = runcase(case,_worker['scratch'],_worker['savedir'],_worker['shdcache'],_worker['eph'],records,_worker['rtcache'])
+	except Exception:
+		status = 1
+		stageerror(records,fileprefix(case)[:-1])
+	return case,status,records
+
+####################################################################################################
+## Run a list of cases on a pool of nworkers processes
+#  Shadow results are shared between workers through the shdcache directory (if given)
+#  If ephpath is given, geometry comes from that buildephemeris() table and Shadow never runs
+#  If storedir is given, each finished run is also added to that lyao_store (see storecreate)
+#  If journal is given, cases already completed in that journal are skipped and every
+#  	finished run is recorded there, so an interrupted sweep can simply be restarted
+#  If telemetry is given, each run's stage timings are appended there (see LYAO_telemetry)
+#  If rtcache is given, test_rt results are shared through that directory (see runrt)
+#  If indexdb is given, each finished run is added to that run index (see lyao_parse.indexsweep)
+#  Returns a list of (case, exit status) in order of completion
+
+def sweep(cases,savedir,LYAOpath,shdpath,nworkers=None,scratchroot=None,shdcache=None,ephpath=None,storedir=None,journal=None,telemetry=None,rtcache=None,indexdb=None):
+	if journal is not None:
+		entries = journalread(journal)
+		ndone = len(cases)
+		cases = [case for case in cases if not casedone(case,entries,savedir)]
+		print("---- Skipping %i Completed Runs ----"%(ndone-len(cases)))
+	if len(cases) == 0:
+		return []
+
+	nworkers = nworkers or os.cpu_count()
+	nworkers = max(1,min(nworkers,len(cases)))
+	scratches = [scratchdir(LYAOpath,shdpath,scratchroot) for x in range(nworkers)]
+	scratchq = mp.Queue()
+	for scratch in scratches:
+		scratchq.put(scratch)
+
+	store = storeopen(storedir,mode='r+') if storedir is not None else None
+	index = indexopen(indexdb) if indexdb is not None else None
+	results = []
+	try:
+		with mp.Pool(nworkers,initializer=_initworker,initargs=(scratchq,savedir,shdcache,ephpath,rtcache)) as pool:
+			t0 = time.time()
+			for case,status,records in pool.imap_unordered(_runcase,cases):
+				# A run the store or index can't take (e.g. more LOS rows than the store holds) fails
+				try:
+					if store is not None and status == 0:
+						storeadd(store,savepath(savedir,case),case['doy'],case['f107'],case['Ap'],case['tm'])
+					if index is not None and status == 0:
+						with index:
+							indexadd(index,savepath(savedir,case))
+				except Exception:
+					status = 1
+					stageerror(records,fileprefix(case)[:-1],'Not Stored')
+				results.append((case,status))
+				if telemetry is not None:
+					telemetrywrite(telemetry,casekey(case),status,records)
+				if journal is not None:
+					journalwrite(journal,case,status,savedir)
+				print("---- Run %s%s: %s ----"%(fileprefix(case)[:-1],
+					"" if status==0 else " FAILED",savepath(savedir,case)))
+				eta = (time.time()-t0)/len(results)*(len(cases)-len(results))
+				print("---- Number of Runs So Far: %i/%i, ETA %.1f min ----"%(len(results),len(cases),eta/60))
+	finally:
+		if index is not None:
+			index.close()
+		for scratch in scratches:
+			shutil.rmtree(scratch,ignore_errors=True)
+	return results
+
+####################################################################################################
+## Adaptive refinement over DOY x f107 x Ap
+#  Starts from a coarse grid (ncoarse values per axis, taken from the candidate doys, f107s, Aps)
+#  For every three neighbouring points along an axis, the middle run's LOS profile is compared
+#  	with the linear interpolation of its neighbours. Where the largest relative error exceeds
+#  	tol, the midpoints of both intervals are added, worst errors first, until budget runs are used
+#  makecases(doy, f107, Ap) returns the cases (e.g. AM & PM) for one point
+#  Other keyword arguments are passed to sweep(); returns {(doy, f107, Ap): profiles or None}
+
+def caseprofile(savedir,case):
+	# Sorted (shdalt, Ha_int) of a saved run, or None if it has no output
+	fpath = os.path.join(savepath(savedir,case),fileprefix(case)+'hab_los.dat')
+	if not os.path.exists(fpath):
+		return None
+	los = Los(fpath)
+	return los.shdalt,los.Ha_int
+
+def interperror(pa,pm,pb,w):
+	# Largest relative error of interpolating pm from pa & pb (weight w toward pb)
+	err = 0
+	for (xa,ya),(xm,ym),(xb,yb) in zip(pa,pm,pb):
+		pred = (1-w)*np.interp(xm,xa,ya,left=np.nan,right=np.nan) + w*np.interp(xm,xb,yb,left=np.nan,right=np.nan)
+		good = np.isfinite(pred) & (ym > 0)
+		if good.any():
+			err = max(err,np.max(np.abs(pred[good]-ym[good])/ym[good]))
+	return err
+
+def refine(profiles,axes,tol):
+	# Candidate points whose neighbouring intervals interpolate worse than tol, with their errors
+	def midpoint(ax,lo,hi):
+		between = [x for x in ax if lo < x < hi]
+		return min(between,key=lambda x: abs(x-(lo+hi)/2)) if between else None
+
+	new = {}
+	pts = [p for p,prof in profiles.items() if prof is not None]
+	for k in range(len(axes)):
+		lines = {}
+		for p in pts:
+			lines.setdefault(p[:k]+p[k+1:],[]).append(p)
+		for line in lines.values():
+			line.sort(key=lambda p: p[k])
+			for a,m,b in zip(line,line[1:],line[2:]):
+				err = interperror(profiles[a],profiles[m],profiles[b],(m[k]-a[k])/(b[k]-a[k]))
+				if err <= tol:
+					continue
+				for lo,hi in [(a,m),(m,b)]:
+					mid = midpoint(axes[k],lo[k],hi[k])
+					if mid is not None:
+						p = lo[:k]+(mid,)+lo[k+1:]
+						new[p] = max(err,new.get(p,0))
+	return {p:err for p,err in new.items() if p not in profiles}
+
+def adaptivesweep(makecases,doys,f107s,Aps,savedir,LYAOpath,shdpath,tol=0.02,budget=None,ncoarse=(13,4,3),**kwargs):
+	axes = [sorted(doys),sorted(f107s),sorted(Aps)]
+	def coarse(ax,n):
+		idx = np.unique(np.round(np.linspace(0,len(ax)-1,min(n,len(ax)))).astype(int))
+		return [ax[i] for i in idx]
+	todo = {p:np.inf for p in itertools.product(*[coarse(ax,n) for ax,n in zip(axes,ncoarse)])}
+
+	profiles = {}
+	nruns = 0
+	while todo:
+		# Worst errors first, up to the budget
+		points = sorted(todo,key=lambda p: -todo[p])
+		if budget is not None:
+			nper = len(makecases(*points[0]))
+			points = points[:max(0,(budget-nruns)//nper)]
+			if not points:
+				print("---- Adaptive Sweep Stopped at Budget: %i Runs ----"%nruns)
+				break
+		cases = [case for p in points for case in makecases(*p)]
+		print("---- Adaptive Sweep: %i New Points, %i Runs ----"%(len(points),len(cases)))
+		sweep(cases,savedir,LYAOpath,shdpath,**kwargs)
+		nruns = nruns + len(cases)
+
+		for p in points:
+			prof = [caseprofile(savedir,case) for case in makecases(*p)]
+			profiles[p] = None if None in prof else prof
+		todo = refine(profiles,axes,tol)
+	return profiles
@@ -0,0 +1,120 @@
+####################################################################################################
+# LYAO Telemetry
+# Contains functions for timing each stage of a run (wall time, CPU time of this process and
+# 	its children, bytes written, exit status), logging one JSON line per run, and summarizing
+# 	a log with per-stage percentiles, throughput and an ETA for the rest of a sweep
+####################################################################################################
+# Outstanding Python Modules: numpy
+####################################################################################################
+# Usage:
+# 	python LYAO_telemetry.py telemetry.jsonl [total number of runs in the sweep]
+####################################################################################################
+# BEGIN CODE
+####################################################################################################
+
+### IMPORT MODULES ###
+import os, sys, json, time, traceback
+from contextlib import contextmanager
+import numpy as np
+
+####################################################################################################
+## Time one stage of a run
+#  Use as:	with stage(records,'shadow') as rec:
+#  				...
+#  				rec['bytes'] = os.path.getsize(fout)
+#  The block may also set rec['status']; a record is appended to records when the block exits
+
+@contextmanager
+def stage(records,name):
+	rec = {'stage':name}
+	t0,c0 = time.perf_counter(),os.times()
+	try:
+		yield rec
+	except Exception:
+		rec.setdefault('status','error')
+		raise
+	finally:
+		c1 = os.times()
+		rec['wall'] = time.perf_counter()-t0
+		rec['cpu'] = (c1.user-c0.user)+(c1.system-c0.system)
+		rec['cpu_children'] = (c1.children_user-c0.children_user)+(c1.children_system-c0.children_system)
+		records.append(rec)
+
+####################################################################################################
+## Record the exception being handled as an 'error' stage with its traceback, and print it
+#  Call from an except block; name labels the run in the message, e.g. "doy-1_AM_f107-70 Raised"
+
+def stageerror(records,name,event='Raised'):
+	rec = {'stage':'error','wall':0.,'cpu':0.,'cpu_children':0.,'traceback':traceback.format_exc()}
+	records.append(rec)
+	print("---- Run %s %s ----\n%s"%(name,event,rec['traceback']))
+	return rec
+
+####################################################################################################
+## Append one run's stage records to a JSON-lines log
+
+def telemetrywrite(fpath,key,status,records):
+	entry = {'key':key,'status':status,'time':time.time(),
+		'wall':sum(rec['wall'] for rec in records),'stages':records}
+	with open(fpath,'a') as id:
+		id.write(json.dumps(entry)+'\n')
+	return entry
+
+def telemetryread(fpath):
+	entries = []
+	with open(fpath) as id:
+		for line in id:
+			try:
+				entries.append(json.loads(line))
+			except ValueError:
+				continue # partial line from a sweep that died mid-write
+	return entries
+
+####################################################################################################
+## Summarize a log: per-stage percentiles, throughput & ETA
+#  total is the number of runs in the whole sweep, for the ETA
+
+def telemetrysummary(entries,total=None):
+	stages = {}
+	for entry in entries:
+		for rec in entry['stages']:
+			stages.setdefault(rec['stage'],[]).append(rec)
+
+	report = {'runs':len(entries),'failed':sum(entry['status'] != 0 for entry in entries),'stages':{}}
+	walltot = sum(rec['wall'] for recs in stages.values() for rec in recs) or 1
+	for name,recs in stages.items():
+		wall = np.array([rec['wall'] for rec in recs])
+		report['stages'][name] = {'n':len(recs),
+			'p50':float(np.percentile(wall,50)),'p90':float(np.percentile(wall,90)),
+			'p99':float(np.percentile(wall,99)),'total':float(wall.sum()),
+			'share':float(wall.sum()/walltot),
+			'cpu':float(sum(rec['cpu']+rec['cpu_children'] for rec in recs)),
+			'bytes':int(sum(rec.get('bytes',0) for rec in recs)),
+			'cached':int(sum(rec.get('cached',False) for rec in recs))}
+
+	## Throughput over the logged period, and time left at that rate
+	if len(entries) > 1:
+		tms = [entry['time'] for entry in entries]
+		elapsed = max(tms)-min(tms)+np.median([entry['wall'] for entry in entries])
+		report['runs_per_s'] = len(entries)/elapsed
+		if total is not None:
+			report['eta_s'] = max(0,total-len(entries))/report['runs_per_s']
+	return report
+
+def telemetryprint(report):
+	print('---- %i Runs, %i Failed ----'%(report['runs'],report['failed']))
+	print('%-14s %7s %10s %10s %10s %7s %10s %12s'%('stage','n','p50 (s)','p90 (s)','p99 (s)','share','cpu (s)','bytes'))
+	for name,s in sorted(report['stages'].items(),key=lambda x: -x[1]['total']):
+		print('%-14s %7i %10.4f %10.4f %10.4f %6.1f%% %10.1f %12i'%(name,s['n'],s['p50'],s['p90'],s['p99'],
+			100*s['share'],s['cpu'],s['bytes']))
+	for name,s in report['stages'].items():
+		if s['cached']:
+			print('---- %s: %i of %i from cache ----'%(name,s['cached'],s['n']))
+	if 'runs_per_s' in report:
+		print('---- Throughput: %.2f runs/s ----'%report['runs_per_s'])
+	if 'eta_s' in report:
+		print('---- ETA: %.1f hours ----'%(report['eta_s']/3600))
+
+if __name__ == '__main__':
+	total = int(sys.argv[2]) if len(sys.argv) > 2 else None
+	telemetryprint(telemetrysummary(telemetryread(sys.argv[1]),total))
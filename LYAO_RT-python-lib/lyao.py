@@ -0,0 +1,202 @@
+####################################################################################################
+# lyao
+# Command-line entry point for running, sweeping, parsing and plotting LYAO_RT runs
+# Each subcommand imports only the modules it needs: 'parse' loads lyao_parse & NumPy only,
+# 	pandas is loaded by 'run' & 'sweep', and matplotlib by 'plot'
+####################################################################################################
+# Dependencies: LYAO_inputsbuilder.py, LYAO_sweep.py, LYAO_queue.py, LYAO_geometry.py, lyao_parse.py,
+# 	shadow.exe (Jeff Percival, UW-Mad), LYAO_RT (James Bishop)
+# Outstanding Python Modules: numpy, pandas (run, sweep), matplotlib (plot)
+####################################################################################################
+# Usage:
+# 	python lyao.py run --site pbo --year 2000 --doy 80 --f107 70 --Ap 5 --savedir ../PBO_runs/
+# 	python lyao.py sweep --site pbo --year 2000 --doys 1 366 --f107s 70 210 --savedir ../PBO_finegrid/
+# 	python lyao.py parse ../PBO_finegrid/DOY_80/f107_70/AM
+# 	python lyao.py parse --index ../PBO_finegrid/runs.db tm=PM f107=100:150 month=3
+# 	python lyao.py plot ../PBO_finegrid/DOY_80/f107_70/AM ../PBO_finegrid/DOY_80/f107_70/PM --out los.png
+####################################################################################################
+# BEGIN CODE
+####################################################################################################
+
+### IMPORT MODULES ###
+import os, sys, argparse
+
+## Paths to the shipped executables & calendars
+path = os.path.abspath(os.path.dirname(__file__))+"/"
+LYAOpath = path+'../LYAO_RT/'
+shdpath = path+'../Shadow/'
+USNOpath = path+'../USNO/%s-%i-Nautical-Twilight-USNO.txt'
+
+####################################################################################################
+## Cases for a site, year & grid, as in LYAO_iterate.py
+#  The USNO table for the site & year is used if there is one, otherwise the calendar is computed
+
+def makecases(site,year,doys,f107s,Aps,UTCoffset,hours=(11,4),dst=(),UTCdst=None,calendar=None,tms=("AM","PM")):
+	from datetime import datetime
+	from LYAO_inputsbuilder import twilightindex, twilightwindows
+	calendar = calendar or USNOpath%(site.upper(),year)
+	if not os.path.exists(calendar):
+		from LYAO_geometry import geosite, twilightcalc
+		lat,lon,alt = geosite(site)
+		calendar = twilightcalc(lat,lon,year)
+	dawns,dusks,midnights = twilightwindows(twilightindex(calendar,year,UTCoffset,dst=dst,UTCdst=UTCdst))
+
+	cases = []
+	for doy in doys:
+		date = datetime.strptime("%i %i"%(year,doy),"%Y %j")
+		windows = {"AM":[midnights[doy-1],dawns[doy-1],10],"PM":[dusks[doy-1],midnights[doy-1],10]}
+		hrs = {"AM":hours[0],"PM":hours[1]}
+		for f107 in f107s:
+			for Ap in Aps:
+				for tm in tms:
+					cases.append({'observer':site,'doy':str(doy),'f107':f107,'Ap':Ap,'tm':tm,'tmint':windows[tm],
+						'dt':date.replace(hour=hrs[tm]),'Apdir':len(Aps) > 1})
+	return cases
+
+####################################################################################################
+## Subcommands
+
+def cmdrun(args):
+	from LYAO_sweep import sweep
+	cases = makecases(args.site,args.year,args.doys,args.f107s,args.Aps,args.utcoffset,args.hours,
+		range(args.dst[0],args.dst[1]+1) if args.dst else (),args.utcdst,args.calendar,args.tms)
+	## A new store is made on the case axes; an existing one is added to
+	if args.storedir is not None and not os.path.exists(os.path.join(args.storedir,'axes.json')):
+		from lyao_store import storecreate
+		storecreate(args.storedir,args.doys,args.f107s,args.Aps,args.tms)
+	if args.queue is not None:
+		from LYAO_queue import enqueue
+		print("---- %i Runs Added to %s ----"%(enqueue(args.queue,cases,args.savedir),args.queue))
+		return 0
+	results = sweep(cases,args.savedir,args.LYAOpath,args.shdpath,nworkers=args.nworkers,
+		shdcache=args.shdcache,ephpath=args.ephpath,storedir=args.storedir,journal=args.journal,
+		telemetry=args.telemetry,rtcache=args.rtcache,indexdb=args.indexdb)
+	failed = [case for case,status in results if status != 0]
+	print("---- %i Runs Saved to %s, %i Failed ----"%(len(results)-len(failed),args.savedir,len(failed)))
+	return 1 if failed else 0
+
+def criteria(terms):
+	# key=value, key=low:high or key=a,b,c
+	def num(x):
+		try:
+			return float(x)
+		except ValueError:
+			return x
+	out = {}
+	for term in terms:
+		key,val = term.split('=',1)
+		if ':' in val:
+			out[key] = tuple(num(x) for x in val.split(':',1))
+		elif ',' in val:
+			out[key] = [num(x) for x in val.split(',')]
+		else:
+			out[key] = num(val)
+	return out
+
+def cmdparse(args):
+	from lyao_parse import LYAO_RT, runfiles, queryindex
+	if args.index is not None:
+		for row in queryindex(args.index,**criteria(args.targets)):
+			print('%s DOY %3i f107 %6.1f Ap %5.1f %s'%(row['savedir'],row['doy'],row['f107'],row['ap'],row['tm']))
+		return 0
+	status = 0
+	for savedir in args.targets:
+		if runfiles(savedir) is None:
+			print('%s: missing infile, H_alpha.source or hab_los.dat'%savedir,file=sys.stderr)
+			status = 1
+			continue
+		run = LYAO_RT(savedir)
+		print('# %s'%savedir)
+		if not args.quiet:
+			print(run.inf.info)
+		if args.src:
+			print('%10s %12s %12s %10s'%('z','H','O2','T'))
+			for row in zip(run.src.z,run.src.H,run.src.O2,run.src.T):
+				print('%10.2f %12.4e %12.4e %10.2f'%row)
+		else:
+			print('%10s %10s'%('shdalt','Ha_int'))
+			for row in zip(run.los.shdalt,run.los.Ha_int):
+				print('%10.3f %10.3f'%row)
+	return status
+
+def cmdplot(args):
+	import matplotlib
+	matplotlib.use('Agg') # render headless, before anything imports pyplot
+	import matplotlib.pyplot as plt
+	from lyao_parse import LYAO_RT, IntCSS, HDensCSS
+	fig,(ax1,ax2) = plt.subplots(1,2,figsize=(10,4.5))
+	for savedir in args.savedirs:
+		run = LYAO_RT(savedir)
+		label = os.path.relpath(savedir)
+		ax1.plot(run.los.shdalt,run.los.Ha_int,label=label)
+		ax2.plot(run.src.H,run.src.z,label=label)
+	IntCSS(ax1)
+	HDensCSS(ax2)
+	ax1.legend(fontsize='small')
+	fig.tight_layout()
+	fig.savefig(args.out)
+	print('---- Saved %s ----'%args.out)
+	return 0
+
+####################################################################################################
+## Command line
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='lyao',description='Run, sweep, parse and plot LYAO_RT runs')
+	sub = parser.add_subparsers(dest='cmd')
+
+	## run & sweep share every option; run takes one DOY, f10.7 & Ap, sweep takes ranges
+	def runopts(p,single):
+		p.add_argument('--site',default='pbo',help='Shadow preset: pbo, kpno, wiyn, ctio or erau')
+		p.add_argument('--year',type=int,default=2000)
+		if single:
+			p.add_argument('--doy',dest='doys',type=int,nargs=1,required=True)
+			p.add_argument('--f107',dest='f107s',type=float,nargs=1,default=[70.])
+			p.add_argument('--Ap',dest='Aps',type=float,nargs=1,default=[5.])
+		else:
+			p.add_argument('--doys',type=int,nargs=2,default=None,metavar=('FIRST','LAST'),help='inclusive (default: whole year)')
+			p.add_argument('--f107s',type=float,nargs='+',default=[70.])
+			p.add_argument('--Aps',type=float,nargs='+',default=[5.])
+		p.add_argument('--tms',nargs='+',default=['AM','PM'],choices=['AM','PM'])
+		p.add_argument('--hours',type=int,nargs=2,default=[11,4],metavar=('AM','PM'),help='UT hours of the RT inputs')
+		p.add_argument('--utcoffset',type=int,default=6)
+		p.add_argument('--dst',type=int,nargs=2,default=None,metavar=('FIRST','LAST'),help='DOYs on daylight time')
+		p.add_argument('--utcdst',type=int,default=None)
+		p.add_argument('--calendar',default=None,help='USNO table (default: shipped table, or computed)')
+		p.add_argument('--savedir',required=True)
+		p.add_argument('--LYAOpath',default=LYAOpath)
+		p.add_argument('--shdpath',default=shdpath)
+		p.add_argument('--nworkers',type=int,default=None)
+		for opt in ['shdcache','ephpath','storedir','journal','telemetry','rtcache','indexdb']:
+			p.add_argument('--'+opt,default=None)
+		p.add_argument('--queue',default=None,help='enqueue into this LYAO_queue database instead of running')
+	runopts(sub.add_parser('run',help='run one DOY, f10.7 & Ap (AM & PM)'),True)
+	runopts(sub.add_parser('sweep',help='run a DOY x f10.7 x Ap grid on a process pool'),False)
+
+	p = sub.add_parser('parse',help='print the LOS (or source) profile of saved runs')
+	p.add_argument('targets',nargs='+',help='run directories, or criteria (key=value, key=low:high) with --index')
+	p.add_argument('--index',default=None,help='run index from lyao_parse.indexsweep')
+	p.add_argument('--src',action='store_true',help='print the source profile instead of the LOS')
+	p.add_argument('-q','--quiet',action='store_true',help="don't print the infile")
+
+	p = sub.add_parser('plot',help='plot LOS intensity & H density of saved runs')
+	p.add_argument('savedirs',nargs='+')
+	p.add_argument('--out',default='lyao.png')
+
+	args = parser.parse_args(argv)
+	if args.cmd in ('run','sweep'):
+		if args.doys is None:
+			from calendar import isleap
+			args.doys = [1,365+isleap(args.year)]
+		if args.cmd == 'sweep':
+			args.doys = list(range(args.doys[0],args.doys[1]+1))
+		return cmdrun(args)
+	elif args.cmd == 'parse':
+		return cmdparse(args)
+	elif args.cmd == 'plot':
+		return cmdplot(args)
+	parser.print_help()
+	return 2
+
+if __name__ == '__main__':
+	sys.exit(main())
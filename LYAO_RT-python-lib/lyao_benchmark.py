@@ -0,0 +1,266 @@
+####################################################################################################
+# LYAO Benchmark
+# Times each stage of the run/parse pipeline on its own, and whole sweeps end to end,
+# 	at several scales (1 night, 1 month, 1 year)
+# Parse stages use synthetic fixtures scaled up from the example files in LYAO_RT/: longer
+# 	hab_los.dat files, H_alpha.source files with finer MSIS grids, and larger sweep trees
+# Results are written as JSON so that two versions can be compared with --compare
+# The cold start of 'lyao parse' is also timed and checked against coldtarget
+####################################################################################################
+# Dependencies: LYAO_inputsbuilder.py, LYAO_sweep.py, LYAO_geometry.py, lyao_parse.py,
+# 	shadow.exe (Jeff Percival, UW-Mad), LYAO_RT (James Bishop)
+# Outstanding Python Modules: numpy, pandas
+####################################################################################################
+# Usage:
+# 	python lyao_benchmark.py --out bench.json
+# 	python lyao_benchmark.py --scales night month --e2e --out bench.json
+# 	python lyao_benchmark.py --out new.json --compare old.json
+####################################################################################################
+# BEGIN CODE
+####################################################################################################
+
+### IMPORT MODULES ###
+import os, sys, json, time, shutil, tempfile, argparse, platform, subprocess
+from datetime import datetime, timedelta
+import numpy as np
+from LYAO_inputsbuilder import *
+from LYAO_sweep import *
+from lyao_parse import Infile, Source, Los, loadruns
+from LYAO_geometry import geometry
+
+## Paths to the shipped executables, calendars & example files
+path = os.path.abspath(os.path.dirname(__file__))+"/"
+LYAOpath = path+'../LYAO_RT/'
+shdpath = path+'../Shadow/'
+USNOpath = path+'../USNO/PBO-2000-Nautical-Twilight-USNO.txt'
+
+## Number of nights at each scale
+scales = {'night':1,'month':30,'year':366}
+
+## Target for the cold start of 'lyao parse' on one run, in seconds
+coldtarget = 0.5
+
+## One line of Shadow output, used to build synthetic Shadow text
+shdsample = ('ra/dec +14H 59M 45.738S +43D 04\' 29.110" shadow distance    250.280 km altitude    240.706 km '
+	'targ az    0.0 zd    0.0 sun az  -41.4 zd  101.5 diff-az   41.4 utc %s last +14H 59M 47.220S '
+	'vlsr 0.125711 km/s l/b +04H 51M 44.945S +59D 34\' 11.180" ha 3.92143964650121e-32\n')
+
+####################################################################################################
+## Timing helpers
+
+def timed(fn,repeat=5):
+	# Seconds for each of repeat calls of fn()
+	tms = []
+	for x in range(repeat):
+		t0 = time.perf_counter()
+		fn()
+		tms.append(time.perf_counter()-t0)
+	return tms
+
+def summary(tms,n=1):
+	# n is the number of items (lines, files, runs) handled per call
+	tms = np.array(tms)
+	return {'repeat':len(tms),'n':n,'min':float(tms.min()),'median':float(np.median(tms)),
+		'mean':float(tms.mean()),'per_item':float(np.median(tms))/n}
+
+def runnable(fpath):
+	# Executables are shipped without execute permission, and need their libraries to load
+	if not os.access(fpath,os.X_OK):
+		return False
+	tmp = tempfile.mkdtemp(prefix='lyao_check_')
+	try:
+		proc = subprocess.run([fpath],stdin=subprocess.DEVNULL,stdout=subprocess.DEVNULL,
+			stderr=subprocess.PIPE,cwd=tmp)
+	finally:
+		shutil.rmtree(tmp,ignore_errors=True)
+	return b'error while loading shared libraries' not in proc.stderr
+
+####################################################################################################
+## Synthetic fixtures
+
+def shdfixture(nights,dt=10):
+	# Shadow text for nights of 12 hours at dt-minute cadence
+	t0 = datetime(2000,1,1)
+	nrows = nights*12*60//dt
+	return ''.join(shdsample%(t0+timedelta(minutes=dt*i)).strftime('%Y %m %d %H %M %S.001') for i in range(nrows))
+
+def losfixture(fixdir,nights):
+	# A hab_los.dat with one night of rows per night, scaled from the example file
+	lines = open(LYAOpath+'hab_los.dat').read().splitlines()
+	rows = np.array(' '.join(lines[1:]).split(),dtype=float).reshape(-1,5)
+	reps = int(np.ceil(nights*72/len(rows)))
+	rows = np.tile(rows,(reps,1))
+	rows[:,3] = rows[:,3] + np.repeat(np.arange(reps),len(lines)-1)*1e-3
+	fpath = os.path.join(fixdir,'hab_los_%i.dat'%nights)
+	with open(fpath,'w') as id:
+		id.write('%5i%s\n'%(len(rows),lines[0][5:]))
+		for row in rows:
+			id.write(''.join('%11.3f'%x for x in row)+'\n')
+	return fpath
+
+def srcfixture(fixdir,nights):
+	# An H_alpha.source whose MSIS grid is nights times finer than the example file's,
+	# 	interpolated between its rows; the zone sections are kept as they are
+	lines = open(LYAOpath+'H_alpha.source').read().splitlines()
+	first = [i for i,line in enumerate(lines) if 'MSIS' in line][0]+2
+	last = [i for i,line in enumerate(lines) if 'EXOSPHERE & OPTICAL QUANTITIES' in line][0]
+	rows = np.array(' '.join(lines[first:last]).split(),dtype=float).reshape(-1,5)
+	x = np.linspace(0,len(rows)-1,(len(rows)-1)*nights+1)
+	rows = np.array([np.interp(x,np.arange(len(rows)),col) for col in rows.T]).T
+	fpath = os.path.join(fixdir,'H_alpha_%i.source'%nights)
+	with open(fpath,'w') as id:
+		id.write('\n'.join(lines[:first])+'\n')
+		for row in rows:
+			id.write(''.join(' %.4E'%x for x in row)+'\n')
+		id.write('\n'.join(lines[last:])+'\n')
+	return fpath,len(rows)
+
+def runfixtures(fixdir,nights):
+	# nights*2 copies of the example run (AM & PM), laid out as a sweep tree
+	for doy in range(1,nights+1):
+		for tm in ["AM","PM"]:
+			d = os.path.join(fixdir,'sweep_%i'%nights,"DOY_%i/f107_70/%s"%(doy,tm))
+			os.makedirs(d,exist_ok=True)
+			for fn in ['infile.dat','H_alpha.source','hab_los.dat']:
+				shutil.copyfile(LYAOpath+fn,os.path.join(d,'doy-%i_%s_f107-70_%s'%(doy,tm,fn)))
+	return os.path.join(fixdir,'sweep_%i'%nights)
+
+####################################################################################################
+## Stages
+
+def benchstages(scale,repeat,fixdir):
+	nights = scales[scale]
+	results = {}
+
+	## Shadow launch & parse
+	if runnable(shdpath+'shadow'):
+		tmint = ('2000 01 01 00 00 00',dt2shd(datetime(2000,1,1)+timedelta(hours=12*nights)),10)
+		scratch = scratchdir(LYAOpath,shdpath,fixdir)
+		results['shadow'] = summary(timed(lambda: shadow('pbo',tmint,shdpath=scratch+'/Shadow/'),repeat),nights)
+	else:
+		results['shadow'] = {'skipped':'shadow executable not runnable'}
+	results['geometry'] = summary(timed(lambda: geometry('pbo',('2000 01 01 00 00 00',
+		dt2shd(datetime(2000,1,1)+timedelta(hours=12*nights)),10)),repeat),nights)
+	text = shdfixture(nights)
+	results['shdbatch'] = summary(timed(lambda: shdbatch(text),repeat),text.count('\n'))
+	lines = text.splitlines(True)[:1000]
+	results['shdparser'] = summary(timed(lambda: [shdparser(line) for line in lines],repeat),len(lines))
+
+	## LOS input file
+	shdwdf = shdbatch(text)
+	results['shd2los'] = summary(timed(lambda: shd2los(shdwdf,os.path.join(fixdir,'inputs_los.dat')),repeat),len(shdwdf))
+
+	## Twilight calendars
+	results['USNOparser'] = summary(timed(lambda: USNOparser(USNOpath),repeat))
+	results['twilightindex'] = summary(timed(lambda: twilightwindows(twilightindex(USNOpath,2000,6)),repeat),366)
+
+	## LYAO_RT executables, in a scratch directory with the example inputs
+	for exe,stdin in [('test_rt','infile.dat'),('test_los',None)]:
+		if not runnable(LYAOpath+exe):
+			results[exe] = {'skipped':'%s executable not runnable'%exe}
+			continue
+		scratch = scratchdir(LYAOpath,shdpath,fixdir)+'/LYAO_RT/'
+		for fn in ['infile.dat','inputs_los.dat','H_alpha.source']:
+			shutil.copyfile(LYAOpath+fn,scratch+fn)
+		def run():
+			with open(scratch+'infile.dat') as id:
+				subprocess.run(['./'+exe],stdin=id if stdin else subprocess.DEVNULL,cwd=scratch,
+					stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+		results[exe] = summary(timed(run,repeat))
+
+	## lyao_parse classes
+	losfile = losfixture(fixdir,nights)
+	results['Infile'] = summary(timed(lambda: Infile(LYAOpath+'infile.dat').ly,repeat))
+	srcfile,nmsis = srcfixture(fixdir,nights)
+	results['Source'] = summary(timed(lambda: Source(srcfile).z,repeat),nmsis)
+	results['Los'] = summary(timed(lambda: Los(losfile).shdalt,repeat),nights*72)
+	sweepdir = runfixtures(fixdir,nights)
+	results['loadruns'] = summary(timed(lambda: loadruns(sweepdir,range(1,nights+1),[70]),repeat),nights*2)
+
+	## Plot gridding: one LOS profile per DOY onto a common shadow altitude axis
+	profiles = loadruns(sweepdir,range(1,nights+1),[70],parts=('los',))
+	yi = np.linspace(250,580,100)
+	def grid():
+		zi = np.empty((len(yi),len(profiles)))
+		for k,run in enumerate(profiles.values()):
+			zi[:,k] = np.interp(yi,run.los.shdalt,run.los.Ha_int,left=np.nan,right=np.nan)
+	results['gridding'] = summary(timed(grid,repeat),len(profiles))
+	return results
+
+def benche2e(scale,fixdir,nworkers=None):
+	# Whole sweep: nights x AM/PM at one f10.7, with the real executables
+	if not (runnable(shdpath+'shadow') and runnable(LYAOpath+'test_rt')):
+		return {'skipped':'shadow or LYAO_RT executables not runnable'}
+	nights = scales[scale]
+	dawn,dusk,midnight = twilightwindows(twilightindex(USNOpath,2000,6))
+	cases = []
+	for doy in range(1,nights+1):
+		date = datetime(2000,1,1)+timedelta(days=doy-1)
+		for tm,dt,tmint in [("AM",date.replace(hour=11),[midnight[doy-1],dawn[doy-1],10]),
+			("PM",date.replace(hour=4),[dusk[doy-1],midnight[doy-1],10])]:
+			cases.append({'observer':'pbo','doy':str(doy),'f107':70,'Ap':5,'tm':tm,'tmint':tmint,'dt':dt})
+	t0 = time.perf_counter()
+	results = sweep(cases,os.path.join(fixdir,'e2e_%s/'%scale),LYAOpath,shdpath,nworkers=nworkers)
+	wall = time.perf_counter()-t0
+	return {'runs':len(cases),'failed':sum(status != 0 for case,status in results),
+		'wall':wall,'runs_per_s':len(cases)/wall}
+
+####################################################################################################
+## Cold start: a fresh interpreter running 'lyao parse' on the example run
+
+def benchcold(repeat):
+	args = [sys.executable,path+'lyao.py','parse','-q',LYAOpath]
+	res = summary(timed(lambda: subprocess.run(args,stdout=subprocess.DEVNULL,check=True),repeat))
+	res.update({'target':coldtarget,'ok':res['median'] <= coldtarget})
+	return res
+
+####################################################################################################
+## Compare two result files: ratio of new/old median per stage
+
+def compare(new,old):
+	print('%-16s %-8s %12s %12s %8s'%('stage','scale','old (s)','new (s)','new/old'))
+	if 'median' in new.get('coldstart',{}) and 'median' in old.get('coldstart',{}):
+		print('%-16s %-8s %12.6f %12.6f %8.2f'%('coldstart','',old['coldstart']['median'],new['coldstart']['median'],
+			new['coldstart']['median']/old['coldstart']['median']))
+	for scale in new['stages']:
+		for stage,res in new['stages'][scale].items():
+			ref = old.get('stages',{}).get(scale,{}).get(stage,{})
+			if 'median' in res and 'median' in ref:
+				print('%-16s %-8s %12.6f %12.6f %8.2f'%(stage,scale,ref['median'],res['median'],res['median']/ref['median']))
+
+####################################################################################################
+## Command line
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Benchmark the LYAO_RT run/parse pipeline')
+	parser.add_argument('--scales',nargs='+',default=['night','month'],choices=list(scales))
+	parser.add_argument('--repeat',type=int,default=5)
+	parser.add_argument('--e2e',action='store_true',help='also time whole sweeps with the executables')
+	parser.add_argument('--nworkers',type=int,default=None)
+	parser.add_argument('--out',default=None,help='write results as JSON')
+	parser.add_argument('--compare',default=None,help='earlier JSON results to compare against')
+	args = parser.parse_args()
+
+	fixdir = tempfile.mkdtemp(prefix='lyao_bench_')
+	try:
+		out = {'time':datetime.utcnow().isoformat(),'python':platform.python_version(),
+			'numpy':np.__version__,'host':platform.node(),'ncpu':os.cpu_count(),
+			'commit':subprocess.run(['git','rev-parse','HEAD'],cwd=path,stdout=subprocess.PIPE,
+				stderr=subprocess.DEVNULL,universal_newlines=True).stdout.strip(),
+			'stages':{},'e2e':{},'coldstart':benchcold(args.repeat)}
+		for scale in args.scales:
+			out['stages'][scale] = benchstages(scale,args.repeat,fixdir)
+			if args.e2e:
+				out['e2e'][scale] = benche2e(scale,fixdir,args.nworkers)
+	finally:
+		shutil.rmtree(fixdir,ignore_errors=True)
+
+	print(json.dumps(out,indent=1))
+	if args.out is not None:
+		with open(args.out,'w') as id:
+			json.dump(out,id,indent=1)
+	if args.compare is not None:
+		with open(args.compare) as id:
+			compare(out,json.load(id))
+	if not out['coldstart']['ok']:
+		print("---- 'lyao parse' cold start %.3f s is over the %.3f s target ----"%(out['coldstart']['median'],coldtarget))
@@ -51,21 +51,55 @@
 #	__.los			--	los file parameters
 #	__.los.Ha_int	--	H-alpha emission intensity
 #	__.los.shdalt	--	Shadow Altitude
+#	__.los.branch	--	H-alpha branching ratio used by test_los (from the header)
+#	__.los.flux		--	Solar line center flux used by test_los (from the header)
+#
+## Each file is parsed lazily, the first time one of its attributes is read.
+## Profiles are NumPy arrays.
+##
+## Selecting runs from an index (see Run Index below)
+#  indexsweep("PBO_finegrid","PBO_finegrid/runs.db")
+#  runs = queryruns("PBO_finegrid/runs.db",tm="PM",f107=(100,150),ap=5,month=3)
 
-import os, sys
+import os, sys, pickle, hashlib, sqlite3, tempfile
+from datetime import datetime, timedelta
+import multiprocessing as mp
 import numpy as np
-from matplotlib import pyplot as plt
 
-class Infile:
-	def __init__(self, infile_filepath):
+class Lazy:
+	## Base class for parsed files: the file is only read the first time
+	## one of its attributes is accessed, then every attribute is set at once
+	__slots__ = ('_filepath','_parsed')
+	
+	def __init__(self, filepath):
+		self._filepath = filepath
+		self._parsed = False
+	
+	def __getattr__(self, name):
+		## Only called for attributes that have not been set yet
+		if name.startswith('_') or self._parsed:
+			raise AttributeError("'%s' object has no attribute '%s'"%(type(self).__name__,name))
+		# Set first so an attribute _parse leaves unset can't recurse; cleared again if the parse
+		# 	fails, so the next access raises the parse error rather than AttributeError
+		self._parsed = True
+		try:
+			self._parse()
+		except BaseException:
+			self._parsed = False
+			raise
+		return getattr(self,name)
+
+class Infile(Lazy):
+	__slots__ = ('info','ly','loc','time','ap','f107','msis','exo','flux','peak','igeo','satt','satd')
+	
+	def _parse(self):
 		## Open infile.dat file
-		id = open(infile_filepath)
-		lines = id.readlines()
-		
-		## Inputs.rt text box string
-		id.seek(0,0)
+		id = open(self._filepath)
 		info = id.read()
 		id.close()
+		lines = info.splitlines(True)
+		
+		## Inputs.rt text box string
 		self.info = 'inputs.rt\n'+info[:-1]
 		
 		## Read Lyman Series
@@ -100,100 +134,288 @@ class Infile:
 		self.satt = float(lines[7].split()[1])
 		self.satd = float(lines[7].split()[2])
 
-class Source:
-	def __init__(self,source_filepath):
+class Source(Lazy):
+	__slots__ = ('msis_input','msis_z','msis_r','msis_T','msis_H','msis_O2',
+		'cd_H','cd_O2','cd_tot','cd_exo','z','H','O2','T')
+	
+	## Section headers, and where each section starts relative to its header
+	headers = {"MSIS":2, "EXOSPHERE & OPTICAL QUANTITIES":-1, "COLUMN DENSITIES":1,
+		"NOMINAL CENTROID RADII":1, "HYDROGEN DENSITIES":1,
+		"MOLECULAR OXYGEN DENSITIES":1, "TEMPERATURES":1}
+	
+	def _parse(self):
 		Re = 637100000
 		## Open H_alpha.source file
-		id = open(source_filepath)
+		id = open(self._filepath)
 		lines = id.readlines()
 		id.close()
 		
 		self.msis_input = lines[1].split()[:8]
 		
+		## Find every section in one pass; headers are the only lines with letters
+		start = {}
 		for i,line in enumerate(lines):
-			if "MSIS" in line:
-				msis_start = i+2
-			if "EXOSPHERE & OPTICAL QUANTITIES" in line:
-				msis_end = i-1
-			if "COLUMN DENSITIES" in line:
-				cd_start = i+1
-			if "NOMINAL CENTROID RADII" in line:
-				z_start = i+1
-			if "HYDROGEN DENSITIES" in line:
-				h_start = i+1
-			if "MOLECULAR OXYGEN DENSITIES" in line:
-				o_start = i+1
-			if "TEMPERATURES" in line:
-				t_start = i+1
+			if line[:3].strip().isalpha():
+				for header,offset in self.headers.items():
+					if header in line:
+						start[header] = i+offset
+		
+		def block(first,last):
+			return np.array(' '.join(lines[first:last]).split(),dtype=float)
 		
 		## Read MSIS grid, lines 4-65
-		msis = []
-		for line in lines[msis_start:msis_end+1]:
-			msis.append([float(i) for i in line.split()])
-		self.msis_z = [msis[i][0] for i in range(len(msis))]
-		self.msis_r = [msis[i][1] for i in range(len(msis))]
-		self.msis_T = [msis[i][2] for i in range(len(msis))]
-		self.msis_H = [msis[i][3] for i in range(len(msis))]
-		self.msis_O2 = [msis[i][4] for i in range(len(msis))]
+		msis = block(start["MSIS"],start["EXOSPHERE & OPTICAL QUANTITIES"]+1).reshape(-1,5).T
+		self.msis_z,self.msis_r,self.msis_T,self.msis_H,self.msis_O2 = [np.ascontiguousarray(x) for x in msis]
 		
 		## Read Column Densities, line 69
 		## Order: colmd_H, colmd_O2, colmd_tot, colmd_exo
-		self.cd_H = float(lines[cd_start].split()[0])
-		self.cd_O2 = float(lines[cd_start].split()[1])
-		self.cd_tot = float(lines[cd_start].split()[2])
-		self.cd_exo = float(lines[cd_start].split()[3])
+		cd = block(start["COLUMN DENSITIES"],start["COLUMN DENSITIES"]+1)
+		self.cd_H,self.cd_O2,self.cd_tot,self.cd_exo = [float(x) for x in cd[:4]]
 		
 		## Read Zone Densities and Temperatures
 		## Hydrogen Densities, lines 85-87
 		## O2 Densities, lines 89-91
 		## Temps, lines 93-95
-		z = [float(i) for i in lines[z_start].split()]+[float(i) for i in lines[z_start+1].split()]+[float(i) for i in lines[z_start+2].split()]
-		self.z = [(i-Re)/10**5 for i in z]
-		self.H = [float(i) for i in lines[h_start].split()]+[float(i) for i in lines[h_start+1].split()]+[float(i) for i in lines[h_start+2].split()]
-		self.O2 = [float(i) for i in lines[o_start].split()]+[float(i) for i in lines[o_start+1].split()]+[float(i) for i in lines[o_start+2].split()]
-		self.T = [float(i) for i in lines[t_start].split()]+[float(i) for i in lines[t_start+1].split()]+[float(i) for i in lines[t_start+2].split()]
+		i = start["NOMINAL CENTROID RADII"]
+		self.z = (block(i,i+3)-Re)/10**5
+		i = start["HYDROGEN DENSITIES"]
+		self.H = block(i,i+3)
+		i = start["MOLECULAR OXYGEN DENSITIES"]
+		self.O2 = block(i,i+3)
+		i = start["TEMPERATURES"]
+		self.T = block(i,i+3)
 				 
-class Los:
-	def __init__(self,hablos_filepath):
+class Los(Lazy):
+	__slots__ = ('shdalt','Ha_int','branch','flux')
+	
+	def _parse(self):
 		## Open hab_los.dat file
-		id = open(hablos_filepath)
+		id = open(self._filepath)
 		lines = id.readlines()
 		id.close()
 		
-		## Read Shadow Altitude
-		SA = [round(float(line.split()[3]), 6) for line in lines[1:len(lines)]]
+		## Read header: rows, line label, wavelength, branching ratio, line center flux
+		header = lines[0].split()
+		self.branch = float(header[3])
+		self.flux = float(header[4])
 		
-		## Read Emission Intensities
-		Ha = [float(line.split()[4]) for line in lines[1:len(lines)]]
+		## Read all rows: SZA, ZNTH, AZI, Shadow Altitude, Emission Intensity
+		los = np.array(' '.join(lines[1:]).split(),dtype=float).reshape(-1,5)
+		SA = np.round(los[:,3],6)
+		Ha = los[:,4]
 		
 		## Sort by Shadow Altitude in Ascending Order
-		sorted_los = list(zip(*sorted(zip(SA,Ha),key=lambda x: x[0])))
+		order = np.argsort(SA,kind='stable')
 		
 		## Assign LOS attributes
-		self.shdalt = sorted_los[0]
-		self.Ha_int = sorted_los[1]
+		self.shdalt = SA[order]
+		self.Ha_int = Ha[order]
 		
+def runfiles(savedir):
+	## Find the infile, source and LOS files of a run; None if any is missing
+	flag = 0
+	for dp,dn,fn in os.walk(os.path.normpath(savedir)):
+		for file in fn:
+			if "hab_los" in file:
+				hablos_filepath = dp+"/"+file
+				flag = flag + 1
+			if "alpha" in file:
+				source_filepath = dp+"/"+file
+				flag = flag + 1
+			if ("infile" in file) or ("inputs.rt" in file):
+				infile_filepath = dp+"/"+file
+				flag = flag + 1
+	if flag < 3:
+		return None
+	return infile_filepath,source_filepath,hablos_filepath
+
 class LYAO_RT:	
+	__slots__ = ('inf','src','los')
+	
 	def __init__(self,savedir):
-		flag = 0
-		for dp,dn,fn in os.walk(os.path.normpath(savedir)):
+		files = runfiles(savedir)
+		if files is None:
+			print('\nError: Save Directory does not include all three files.')
+			sys.exit()
+		else:
+			## Each file is parsed the first time one of its attributes is read
+			self.inf = Infile(files[0])
+			self.src = Source(files[1])
+			self.los = Los(files[2])
+
+## Bulk Loading
+#  loadruns(sweepdir,doys,f107s) parses every DOY_x/f107_y/AM|PM run of a sweep
+#  across a process pool and returns a dict of LYAO_RT keyed by (doy, f107, tm).
+#  Only the components named in parts are parsed. If cachedir is given, each parsed
+#  file is pickled there, keyed by its path, modification time and size, so
+#  reopening the same sweep skips parsing files that have not changed.
+
+def cachewrite(fpath,write):
+	## Write a cache file atomically: write(id) fills a mkstemp file beside fpath, which then
+	## replaces fpath, so readers never see a partial file and writers on other hosts sharing
+	## the directory never share a temporary name
+	cachedir = os.path.dirname(fpath) or '.'
+	os.makedirs(cachedir,exist_ok=True)
+	fd,tmp = tempfile.mkstemp(suffix='.tmp',prefix=os.path.basename(fpath)+'.',dir=cachedir)
+	try:
+		with os.fdopen(fd,'wb') as id:
+			write(id)
+		os.replace(tmp,fpath)
+	except BaseException:
+		os.remove(tmp)
+		raise
+
+def parsecached(obj,cachedir=None):
+	## Parse a lazy file object, or load it from the cache
+	if cachedir is not None:
+		st = os.stat(obj._filepath)
+		key = '%s|%i|%i|%s'%(os.path.abspath(obj._filepath),st.st_mtime_ns,st.st_size,','.join(obj.__slots__))
+		fpath = os.path.join(cachedir,hashlib.sha1(key.encode()).hexdigest()+'.pkl')
+		if os.path.exists(fpath):
+			with open(fpath,'rb') as id:
+				return pickle.load(id)
+	getattr(obj,obj.__slots__[0])
+	if cachedir is not None:
+		cachewrite(fpath,lambda id: pickle.dump(obj,id))
+	return obj
+
+def loadrun(savedir,parts=('inf','src','los'),cachedir=None):
+	## Parse the requested parts of one run; None if the run is missing
+	if runfiles(savedir) is None:
+		return None
+	run = LYAO_RT(savedir)
+	for part in parts:
+		setattr(run,part,parsecached(getattr(run,part),cachedir))
+	return run
+
+def _loadrun(args):
+	return args[0],loadrun(*args[1:])
+
+def loadruns(sweepdir,doys,f107s,tms=("AM","PM"),parts=('inf','src','los'),nworkers=None,cachedir=None):
+	jobs = [((doy,f107,tm),os.path.join(sweepdir,"DOY_%i/f107_%i/%s"%(doy,f107,tm)),parts,cachedir)
+		for doy in doys for f107 in f107s for tm in tms]
+	with mp.Pool(nworkers) as pool:
+		return dict(pool.imap(_loadrun,jobs,chunksize=max(1,len(jobs)//(4*(nworkers or os.cpu_count())))))
+
+## Flux & branching ratio scaling
+#  Ha_int is linear in the solar line center flux and the H-alpha branching ratio that test_los
+#  	reports in the hab_los.dat header (los.flux & los.branch; the ratio is ~1-fluorb, not the
+#  	fluorb that shd2los writes), so a run can be rescaled to other values instead of rerun
+#  	(LYAO_sweep.checklinearity tests this against test_los). flux and branch may be arrays:
+#  	the result has their broadcast shape followed by the LOS rows. None keeps the run's own
+#  	value; flux=1, branch=1 gives the intensity per unit flux and H-alpha branching ratio.
+
+def losscaled(los,flux=None,branch=None):
+	scale = 1.
+	if flux is not None:
+		scale = scale*np.asarray(flux,dtype=float)/los.flux
+	if branch is not None:
+		scale = scale*np.asarray(branch,dtype=float)/los.branch
+	return np.multiply.outer(scale,los.Ha_int)
+
+## Run Index
+#  indexsweep(sweepdir,dbpath) walks a sweep once and records every run's infile parameters
+#  and file paths in an SQLite index. Runs whose infile is unchanged (same modification time
+#  and size) are not parsed again, so rerunning it as new runs land only reads the new ones.
+#  queryruns(dbpath,...) returns LYAO_RT handles for every run matching the criteria, e.g.
+#  	queryruns("runs.db",tm="PM",f107=(100,150),ap=5,month=3)
+#  A criterion is a value, a (low, high) range, or a list of values, on any index column.
+
+indexcols = [('ly','INTEGER'),('lat','REAL'),('lon','REAL'),('doy','INTEGER'),('yy','INTEGER'),('hr','REAL'),
+	('apflag','INTEGER'),('ap','REAL'),('f107','REAL'),('f107a','REAL'),('msis','INTEGER'),('exo','REAL'),
+	('flux','REAL'),('peak','REAL'),('igeo','INTEGER'),('satt','REAL'),('satd','REAL'),('month','INTEGER'),('tm','TEXT')]
+
+def indexopen(dbpath):
+	conn = sqlite3.connect(dbpath,timeout=60)
+	conn.execute('CREATE TABLE IF NOT EXISTS runs (savedir TEXT PRIMARY KEY, infile TEXT, source TEXT, los TEXT, '
+		'mtime INTEGER, size INTEGER, %s)'%', '.join('%s %s'%col for col in indexcols))
+	return conn
+
+def indexrow(savedir,files):
+	## Index columns of one run, from its infile and directory name
+	inf = Infile(files[0])
+	year = inf.time[1] + (2000 if inf.time[1] < 50 else 1900)
+	month = (datetime(year,1,1)+timedelta(days=inf.time[0]-1)).month
+	tm = os.path.basename(os.path.normpath(savedir))
+	vals = [inf.ly]+inf.loc+inf.time+inf.ap[:2]+inf.f107+[inf.msis,inf.exo,inf.flux,inf.peak,inf.igeo,inf.satt,inf.satd,
+		month,tm if tm in ('AM','PM') else None]
+	return dict(zip([col for col,typ in indexcols],vals))
+
+def indexadd(conn,savedir,files=None):
+	## Add or update one run; returns False if it is missing a file
+	savedir = os.path.abspath(savedir)
+	files = runfiles(savedir) if files is None else files
+	if files is None:
+		return False
+	st = os.stat(files[0])
+	row = indexrow(savedir,files)
+	conn.execute('INSERT OR REPLACE INTO runs VALUES (%s)'%','.join('?'*(6+len(indexcols))),
+		[savedir]+[os.path.abspath(f) for f in files]+[st.st_mtime_ns,st.st_size]+[row[col] for col,typ in indexcols])
+	return True
+
+def indexsweep(sweepdir,dbpath):
+	## Index every run under sweepdir; returns (added or updated, unchanged, removed)
+	sweepdir = os.path.abspath(sweepdir)
+	conn = indexopen(dbpath)
+	known = {row[0]:row[1:] for row in conn.execute('SELECT savedir,infile,mtime,size FROM runs')
+		if row[0] == sweepdir or row[0].startswith(sweepdir+os.sep)}
+	nnew,nsame = 0,0
+	with conn:
+		for dp,dn,fn in os.walk(sweepdir):
+			## A run directory holds all three files, as in runfiles
+			files = [None,None,None]
 			for file in fn:
 				if "hab_los" in file:
-					hablos_filepath = dp+"/"+file
-					flag = flag + 1
+					files[2] = os.path.join(dp,file)
 				if "alpha" in file:
-					source_filepath = dp+"/"+file
-					flag = flag + 1
+					files[1] = os.path.join(dp,file)
 				if ("infile" in file) or ("inputs.rt" in file):
-					infile_filepath = dp+"/"+file
-					flag = flag + 1
-		if flag < 3:
-			print('\nError: Save Directory does not include all three files.')
-			sys.exit()
+					files[0] = os.path.join(dp,file)
+			if None in files:
+				continue
+			old = known.pop(dp,None)
+			st = os.stat(files[0])
+			if old is not None and old[0] == files[0] and old[1:] == (st.st_mtime_ns,st.st_size):
+				nsame = nsame + 1
+				continue
+			indexadd(conn,dp,files)
+			nnew = nnew + 1
+		## Runs that are gone
+		conn.executemany('DELETE FROM runs WHERE savedir=?',[(d,) for d in known])
+	conn.close()
+	return nnew,nsame,len(known)
+
+def queryindex(dbpath,**criteria):
+	## Index rows (dicts) matching the criteria, ordered by DOY, f10.7, Ap and hour
+	names = ['savedir','infile','source','los']+[col for col,typ in indexcols]
+	where,args = [],[]
+	for col,val in criteria.items():
+		if col not in names:
+			raise ValueError('%s is not an index column'%col)
+		if isinstance(val,tuple):
+			where.append('%s BETWEEN ? AND ?'%col)
+			args += list(val)
+		elif isinstance(val,(list,set)):
+			where.append('%s IN (%s)'%(col,','.join('?'*len(val))))
+			args += list(val)
 		else:
-			self.inf = Infile(infile_filepath)
-			self.src = Source(source_filepath)
-			self.los = Los(hablos_filepath)
+			where.append('%s = ?'%col)
+			args.append(val)
+	conn = indexopen(dbpath)
+	rows = conn.execute('SELECT %s FROM runs%s ORDER BY yy,doy,f107,ap,hr'%(','.join(names),
+		' WHERE '+' AND '.join(where) if where else ''),args).fetchall()
+	conn.close()
+	return [dict(zip(names,row)) for row in rows]
+
+def runhandle(files):
+	## LYAO_RT for known file paths, without walking the run directory
+	run = LYAO_RT.__new__(LYAO_RT)
+	run.inf,run.src,run.los = Infile(files[0]),Source(files[1]),Los(files[2])
+	return run
+
+def queryruns(dbpath,**criteria):
+	## LYAO_RT handles of the matching runs, keyed by run directory; files are parsed lazily
+	return {row['savedir']:runhandle((row['infile'],row['source'],row['los'])) for row in queryindex(dbpath,**criteria)}
 
 def IntCSS(ax,title=r"H-$\alpha$ Emission Intensity"):
 	ax.set_yscale('linear')
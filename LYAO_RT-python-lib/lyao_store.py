@@ -0,0 +1,132 @@
+##	Consolidated store for LYAO_RT sweep results
+#
+## How to Use this Module:
+#  A store is a directory of NumPy .npy arrays, one per quantity, with dimensions
+#  DOY x f107 x Ap x AM/PM (x LOS index or source altitude index).
+#  Arrays are opened as memory maps, so a sweep can add runs as they finish
+#  and readers can slice any part of the store without parsing run directories.
+#
+## Example
+#  from lyao_store import *
+#
+#  store = storecreate("PBO_store",doys=range(1,367),f107s=[70,210],Aps=[5])
+#  storeadd(store,"PBO_finegrid/DOY_1/f107_70/AM",doy=1,f107=70,Ap=5,tm="AM")
+#
+#  store = storeopen("PBO_store")
+#  i = storeindex(store,doy=1,f107=70,Ap=5,tm="AM")
+#  plot(store["shdalt"][i],store["Ha_int"][i])
+#
+## Arrays in a store:
+#	__["Ha_int"]	--	H-alpha emission intensity, per LOS row (NaN padded)
+#	__["shdalt"]	--	Shadow Altitude, per LOS row (NaN padded)
+#	__["z"]			--	IGEO-extended altitudes, per source zone (NaN padded)
+#	__["H"]			--	IGEO-extended Hydrogen Density
+#	__["O2"]		--	IGEO-extended Molecular Oxygen Density
+#	__["T"]			--	IGEO-extended Temperature
+#	__["inf"]		--	infile parameters, columns named by infcols
+#	__["scale"]		--	H-alpha branching ratio & line center flux from the hab_los.dat header
+#						(Ha_int is stored as run, not per unit; see storeintensity)
+#	__["done"]		--	True where a run has been stored
+#	__["axes"]		--	dict of axis values: doys, f107s, Aps, tms
+
+import os, json
+import numpy as np
+from lyao_parse import *
+
+## Infile parameters, in the order they are stored
+infcols = ['ly','lat','lon','doy','yy','hr','apflag','ap','ap1','ap2','ap3','ap4','ap5','ap6',
+	'f107','f107a','msis','exo','flux','peak','igeo','satt','satd']
+
+## Arrays in a store and the name of their trailing dimension
+losvars = ['Ha_int','shdalt']
+srcvars = ['z','H','O2','T']
+
+## Columns of the scale array; stores made before it existed simply don't have it
+scalecols = ['branch','flux']
+
+def storecreate(storedir,doys,f107s,Aps,tms=("AM","PM"),nlos=144,nsrc=25):
+	## Save axes
+	os.makedirs(storedir,exist_ok=True)
+	axes = {'doys':[int(x) for x in doys],'f107s':[float(x) for x in f107s],
+		'Aps':[float(x) for x in Aps],'tms':list(tms),'nlos':nlos,'nsrc':nsrc}
+	with open(os.path.join(storedir,'axes.json'),'w') as id:
+		json.dump(axes,id)
+
+	## Allocate arrays
+	shape = (len(axes['doys']),len(axes['f107s']),len(axes['Aps']),len(axes['tms']))
+	for var,n in [(v,nlos) for v in losvars]+[(v,nsrc) for v in srcvars]+[('inf',len(infcols)),('scale',len(scalecols))]:
+		x = np.lib.format.open_memmap(os.path.join(storedir,var+'.npy'),mode='w+',dtype=np.float32,shape=shape+(n,))
+		x[:] = np.nan
+		x.flush()
+	x = np.lib.format.open_memmap(os.path.join(storedir,'done.npy'),mode='w+',dtype=bool,shape=shape)
+	x.flush()
+	return storeopen(storedir,mode='r+')
+
+def storeopen(storedir,mode='r'):
+	store = {'dir':storedir}
+	with open(os.path.join(storedir,'axes.json')) as id:
+		store['axes'] = json.load(id)
+	for var in losvars+srcvars+['inf','done']:
+		store[var] = np.load(os.path.join(storedir,var+'.npy'),mmap_mode=mode)
+	if os.path.exists(os.path.join(storedir,'scale.npy')):
+		store['scale'] = np.load(os.path.join(storedir,'scale.npy'),mmap_mode=mode)
+	return store
+
+def storeindex(store,doy,f107,Ap,tm):
+	## Index of a run along the DOY, f107, Ap and AM/PM axes
+	axes = store['axes']
+	def find(key,val):
+		i = np.flatnonzero(np.isclose(axes[key],float(val)))
+		if len(i) == 0:
+			raise ValueError('%s=%s is not on the store axes'%(key,val))
+		return int(i[0])
+	return (find('doys',doy),find('f107s',f107),find('Aps',Ap),axes['tms'].index(tm))
+
+def storeput(store,idx,run):
+	## Write one parsed LYAO_RT run into the store
+	def put(var,vals):
+		vals = np.asarray(vals,dtype=np.float32)
+		n = store[var].shape[-1]
+		if len(vals) > n:
+			raise ValueError('%s has %i values but the store only holds %i'%(var,len(vals),n))
+		store[var][idx] = np.nan
+		store[var][idx+(slice(0,len(vals)),)] = vals
+
+	put('Ha_int',run.los.Ha_int)
+	put('shdalt',run.los.shdalt)
+	for var in srcvars:
+		put(var,getattr(run.src,var))
+	inf = run.inf
+	put('inf',[inf.ly]+inf.loc+inf.time+inf.ap+inf.f107+[inf.msis,inf.exo,inf.flux,inf.peak,inf.igeo,inf.satt,inf.satd])
+	if 'scale' in store:
+		put('scale',[run.los.branch,run.los.flux])
+	store['done'][idx] = True
+	for var in losvars+srcvars+['inf','done','scale']:
+		if var in store:
+			store[var].flush()
+
+def storeadd(store,savedir,doy,f107,Ap,tm):
+	## Parse a saved run directory and write it into the store
+	idx = storeindex(store,doy,f107,Ap,tm)
+	storeput(store,idx,LYAO_RT(savedir))
+	return idx
+
+def storeintensity(store,flux=None,branch=None,idx=()):
+	## Ha_int of the stored runs (or store[...][idx]) rescaled to another line center flux and
+	## H-alpha branching ratio, as in lyao_parse.losscaled; scalar flux & branch keep the store's
+	## shape, 1-d arrays (of the same length, if both) add a leading axis
+	## The store keeps Ha_int as test_los wrote it, with the flux & H-alpha branching ratio of
+	## the hab_los.dat header in scale, rather than per unit flux & branching ratio, so stored
+	## intensities read as before; flux=1, branch=1 gives the per-unit intensities
+	Ha_int = np.asarray(store['Ha_int'][idx],dtype=float)
+	if flux is None and branch is None:
+		return Ha_int
+	if 'scale' not in store:
+		raise ValueError('%s was made without line center flux & branching ratio'%store['dir'])
+	scale = np.asarray(store['scale'][idx],dtype=float)
+	factor = 1.
+	if flux is not None:
+		factor = np.multiply.outer(np.asarray(flux,dtype=float),1./scale[...,1])
+	if branch is not None:
+		factor = factor*np.multiply.outer(np.asarray(branch,dtype=float),1./scale[...,0])
+	return factor[...,None]*Ha_int
@@ -0,0 +1,129 @@
+##	Surrogate H-alpha intensity model built from a completed sweep
+#
+## How to Use this Module:
+#  Build a surrogate from a lyao_store, then evaluate H-alpha intensity at any
+#  (DOY, f10.7, Ap, shadow altitude, AM/PM) without running LYAO_RT.
+#  Each run's LOS profile is resampled onto a common shadow altitude axis and
+#  log(Ha_int) is interpolated on the regular DOY x f107 x Ap x shadow altitude grid.
+#  Queries outside the sampled domain return NaN and are flagged, never extrapolated.
+#
+## Example
+#  from lyao_store import *
+#  from lyao_surrogate import *
+#
+#  sur = surrogatebuild(storeopen("PBO_store"))
+#  surrogatesave(sur,"PBO_surrogate.npz")
+#  I,inside = surrogateeval(sur,doy=[80,81],f107=120,Ap=5,shdalt=400,tm="PM")
+#  print(surrogateholdout(storeopen("PBO_store")))
+#
+## Surrogate contents:
+#	__["axes"]		--	dict of grid axes: doy, f107, Ap, shdalt
+#	__["logI"]		--	dict of log(Ha_int) grids, one per AM/PM, shaped (doy, f107, Ap, shdalt)
+#	__["method"]	--	interpolation method ('linear' by default)
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+## Grid axes, in the order of the logI dimensions
+suraxes = ['doy','f107','Ap','shdalt']
+
+def surrogatebuild(store,shdalts=None,nalt=100,method='linear',keep=None):
+	## keep: optional boolean mask over the store's DOY axis, for hold-out tests
+	axes = store['axes']
+	keep = np.ones(len(axes['doys']),dtype=bool) if keep is None else np.asarray(keep)
+
+	## Common shadow altitude axis: by default the range sampled by every stored run
+	shdalt = np.asarray(store['shdalt'])[keep]
+	done = np.asarray(store['done'])[keep]
+	if not done.any():
+		raise ValueError('%s has no completed runs to build a surrogate from'%store.get('dir','store'))
+	if shdalts is None:
+		lo = np.nanmax(np.nanmin(shdalt[done],axis=-1))
+		hi = np.nanmin(np.nanmax(shdalt[done],axis=-1))
+		if not lo < hi:
+			raise ValueError('the completed runs in %s share no shadow altitude range (%.1f to %.1f km): pass shdalts'
+				%(store.get('dir','store'),lo,hi))
+		shdalts = np.linspace(lo,hi,nalt)
+	shdalts = np.asarray(shdalts,dtype=float)
+
+	## Resample each run's LOS profile onto the common axis (NaN outside the run's range)
+	Ha_int = np.asarray(store['Ha_int'])[keep]
+	logI = np.full(done.shape+(len(shdalts),),np.nan)
+	for idx in zip(*np.nonzero(done)):
+		x,y = shdalt[idx],Ha_int[idx]
+		good = np.isfinite(x) & (y > 0)
+		logI[idx] = np.interp(shdalts,x[good],np.log(y[good]),left=np.nan,right=np.nan)
+
+	return {'axes':{'doy':np.asarray(axes['doys'],dtype=float)[keep],'f107':np.asarray(axes['f107s'],dtype=float),
+			'Ap':np.asarray(axes['Aps'],dtype=float),'shdalt':shdalts},
+		'logI':{tm:logI[:,:,:,i] for i,tm in enumerate(axes['tms'])},
+		'method':method}
+
+def surrogateeval(sur,doy,f107,Ap,shdalt,tm):
+	## Returns (Ha_int, inside); inputs broadcast against each other
+	q = np.broadcast_arrays(*[np.asarray(x,dtype=float) for x in (doy,f107,Ap,shdalt)])
+	shape = q[0].shape
+	q = [x.ravel() for x in q]
+
+	## Axes with a single value can't be interpolated: queries must match that value
+	inside = np.ones(len(q[0]),dtype=bool)
+	grid,pts = [],[]
+	for key,x in zip(suraxes,q):
+		ax = sur['axes'][key]
+		if len(ax) == 1:
+			inside &= np.isclose(x,ax[0])
+		else:
+			grid.append(ax)
+			pts.append(x)
+
+	## Build the interpolator once per AM/PM and keep it with the surrogate
+	interps = sur.setdefault('_interp',{})
+	if tm not in interps:
+		logI = sur['logI'][tm].reshape([len(g) for g in grid])
+		interps[tm] = RegularGridInterpolator(grid,logI,method=sur['method'],bounds_error=False,fill_value=np.nan)
+	logI = interps[tm](np.stack(pts,axis=-1))
+
+	## Outside the grid, or in a cell with no sampled runs
+	inside &= np.isfinite(logI)
+	I = np.where(inside,np.exp(logI),np.nan)
+	return I.reshape(shape),inside.reshape(shape)
+
+def surrogatesave(sur,fpath):
+	## Save a surrogate as a single .npz file
+	d = {'axis_'+key:sur['axes'][key] for key in suraxes}
+	d.update({'logI_'+tm:logI for tm,logI in sur['logI'].items()})
+	d['method'] = np.array(sur['method'])
+	np.savez_compressed(fpath,**d)
+
+def surrogateload(fpath):
+	with np.load(fpath) as npz:
+		return {'axes':{key:npz['axis_'+key] for key in suraxes},
+			'logI':{key[5:]:npz[key] for key in npz.files if key.startswith('logI_')},
+			'method':str(npz['method'])}
+
+def surrogateholdout(store,step=5,**kwargs):
+	## Hold-out error estimate: build without every step-th DOY, then compare the surrogate
+	## with those runs' own LOS profiles. Returns relative error percentiles per AM/PM.
+	axes = store['axes']
+	doys = np.asarray(axes['doys'])
+	held = np.zeros(len(doys),dtype=bool)
+	held[step//2:-1:step] = True
+	sur = surrogatebuild(store,keep=~held,**kwargs)
+
+	errors = {}
+	for t,tm in enumerate(axes['tms']):
+		err = []
+		for d in np.flatnonzero(held):
+			for f,f107 in enumerate(axes['f107s']):
+				for a,Ap in enumerate(axes['Aps']):
+					if not store['done'][d,f,a,t]:
+						continue
+					x,y = np.asarray(store['shdalt'][d,f,a,t]),np.asarray(store['Ha_int'][d,f,a,t])
+					I,inside = surrogateeval(sur,doys[d],f107,Ap,x,tm)
+					inside &= np.isfinite(y) & (y > 0)
+					err.append(np.abs(I[inside]-y[inside])/y[inside])
+		err = np.concatenate(err) if err else np.array([])
+		errors[tm] = {'n':len(err)}
+		if len(err):
+			errors[tm].update({'median':float(np.median(err)),'p95':float(np.percentile(err,95)),'max':float(err.max())})
+	return errors
@@ -0,0 +1,40 @@
+## Shared setup for the LYAO_RT-python-lib tests
+#  Run from LYAO_RT-python-lib with 'python -m pytest tests'
+#  Tests that need the Shadow executable use ../Shadow/, or the directory in $LYAO_SHADOW,
+#  	and are skipped when it can't be run; likewise ../LYAO_RT/ or $LYAO_RT for LYAO_RT runs
+
+import os, sys, shutil, subprocess
+import pytest
+
+libdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,libdir)
+
+@pytest.fixture(scope='session')
+def shdpath():
+	path = os.environ.get('LYAO_SHADOW',os.path.join(libdir,'..','Shadow'))
+	path = os.path.join(path,'')
+	try:
+		subprocess.run(['./shadow','-pbo','-utc','2000','1','1','0','0','0'],cwd=path,
+			stdout=subprocess.PIPE,stderr=subprocess.PIPE,check=True)
+	except (OSError,subprocess.CalledProcessError):
+		pytest.skip('Shadow can not be run from %s'%path)
+	return path
+
+@pytest.fixture(scope='session')
+def lyaopath(tmp_path_factory):
+	# A copy of ../LYAO_RT, or of the directory in $LYAO_RT, so runs don't touch the original
+	src = os.environ.get('LYAO_RT',os.path.join(libdir,'..','LYAO_RT'))
+	path = str(tmp_path_factory.mktemp('LYAO_RT'))
+	for fn in os.listdir(src):
+		if os.path.isfile(os.path.join(src,fn)):
+			shutil.copy(os.path.join(src,fn),path)
+	try:
+		for fn in ['test_rt','test_los']:
+			os.chmod(os.path.join(path,fn),0o755)
+		proc = subprocess.run(['./test_los'],cwd=path,stdin=subprocess.DEVNULL,
+			stdout=subprocess.PIPE,stderr=subprocess.PIPE,timeout=60)
+	except (OSError,subprocess.TimeoutExpired):
+		pytest.skip('LYAO_RT can not be run from %s'%src)
+	if proc.returncode in (126,127):
+		pytest.skip('LYAO_RT can not be run from %s'%src)
+	return os.path.join(path,'')
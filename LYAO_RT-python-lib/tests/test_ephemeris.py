@@ -0,0 +1,20 @@
+## LYAO_ephemeris lookups against Shadow & LYAO_geometry
+
+import numpy as np
+from LYAO_ephemeris import *
+from LYAO_geometry import geometry
+
+def test_targha_across_wrap(shdpath):
+	# Point at the local sidereal time of 21:45, so the target hour angle wraps 24 -> 0 there,
+	# 	between the 10-minute rows of the table
+	last = shadow('pbo',"2000 03 10 21 45 00",shdpath=shdpath).last[0]
+	radec = (last,20.)
+	eph = ephtable(shadow('pbo',("2000 03 10 18 00 00","2000 03 11 00 00 00",10),radec=radec,shdpath=shdpath),'pbo',10,radec=radec)
+	window = ("2000 03 10 21 35 00","2000 03 10 21 55 00",5)
+	looked = ephlookup(eph,window)
+	ref = shadow('pbo',window,radec=radec,shdpath=shdpath)
+	new = geometry('pbo',shd2dt64(ref.utc.tolist()).astype('datetime64[ms]'),radec=radec)
+	for other in [ref,new]:
+		diff = (looked.targha.to_numpy()-other.targha.to_numpy()+12)%24-12
+		assert np.all(np.abs(diff) < 0.01)
+	assert looked.targha.min() < 0.1 and looked.targha.max() > 23.9
@@ -0,0 +1,36 @@
+## LYAO_geometry against the Shadow executable, one test per pointing mode
+
+import numpy as np
+import pytest
+from LYAO_geometry import *
+
+## Nights at each site: (site, start, end, minutes), spanning both hemispheres & seasons
+nights = [('pbo',"2000 01 15 00 00 00","2000 01 15 12 00 00",20),
+	('wiyn',"2011 06 20 03 00 00","2011 06 20 12 00 00",20),
+	('ctio',"2024 07 04 00 00 00","2024 07 04 10 00 00",20),
+	('erau',"2030 10 01 00 00 00","2030 10 01 11 00 00",20)]
+
+## Pointings per mode, from near the zenith down to a few degrees above the horizon
+pointings = {'radec':[(2.5,40.),(14.,-20.),(20.,75.)],
+	'hadec':[(0.,30.),(-3.,10.),(4.5,60.)],
+	'azel':[(0.,60.),(6.,30.),(15.,10.)]}
+
+def check(loc,time,**pointing):
+	report = geovalidate(loc,time,**pointing)
+	bad = {col:r for col,r in report.items() if not r['ok']}
+	assert not bad, (loc,pointing,bad)
+
+def test_geotimes_like_shadow():
+	# Shadow doesn't print the end of a -dt 10 interval, but does for -dt 60
+	assert len(geotimes(("2000 01 01 03 00 00","2000 01 01 04 00 00",10))) == 6
+	assert len(geotimes(("2000 01 01 03 00 00","2000 01 01 05 00 00",60))) == 3
+
+@pytest.mark.parametrize('night',nights)
+def test_zenith(shdpath,night):
+	check(night[0],night[1:],shdpath=shdpath)
+
+@pytest.mark.parametrize('night',nights)
+@pytest.mark.parametrize('mode',sorted(pointings))
+def test_pointing(shdpath,night,mode):
+	for pt in pointings[mode]:
+		check(night[0],night[1:],shdpath=shdpath,**{mode:pt})
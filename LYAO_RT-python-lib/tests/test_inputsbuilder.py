@@ -0,0 +1,45 @@
+## LYAO_inputsbuilder: running & parsing Shadow
+
+import os
+import pytest
+import pandas as pd
+from LYAO_inputsbuilder import *
+
+def test_shadowstream_matches_shadow(shdpath):
+	window = ("2000 01 15 00 00 00","2000 01 15 12 00 00",5)
+	batches = list(shadowstream('pbo',window,shdpath=shdpath,chunk=50))
+	assert [len(b) for b in batches[:-1]] == [50]*(len(batches)-1)
+	assert pd.concat(batches,ignore_index=True).equals(shadow('pbo',window,shdpath=shdpath))
+	# Stopping early stops Shadow without an error
+	for batch in shadowstream('pbo',window,shdpath=shdpath,chunk=10):
+		break
+
+def test_shadowstream_raises_on_error(tmp_path):
+	# A Shadow that rejects its arguments
+	with open(tmp_path/'shadow','w') as id:
+		id.write('#!/bin/sh\necho "bad argument: -xyz" >&2\nexit 3\n')
+	os.chmod(tmp_path/'shadow',0o755)
+	with pytest.raises(RuntimeError,match='status 3: bad argument'):
+		list(shadowstream('pbo',("2000 01 15 00 00 00","2000 01 15 12 00 00",5),shdpath=str(tmp_path)+'/'))
+
+def test_shdargs_pointings():
+	# Each angle is three fields, so the next flag is never read as its minutes; Az is in hours
+	tm = "2000 01 15 03 00 00"
+	assert shdargs('pbo',tm,azel=(6.,30.)) == ['-pbo','-utc','2000','01','15','03','00','00',
+		'-az','6.000','0','0','-el','30.000','0','0']
+	assert shdargs('pbo',(tm,"2000 01 15 04 00 00",10),hadec=(-1.5,-20.))[-8:] == ['-ha','-1.500','0','0','-dec','-20.000','0','0']
+	assert shdargs('kpno',[tm],radec=(2.,40.)) == ['-wiyn','-utc','2000','01','15','03','00','00',
+		'-ra','2.000','0','0','-dec','40.000','0','0']
+
+def test_shdargs_azel_runs_east(shdpath):
+	# Az 6 h is due east in Shadow
+	df = shadow('pbo',"2000 01 15 03 00 00",azel=(6.,30.),shdpath=shdpath)
+	assert abs(df.targaz[0]-90.) < 0.2 and abs(df.targzd[0]-60.) < 0.2
+
+def test_shadowcached_writes_cache(tmp_path,shdpath):
+	import LYAO_inputsbuilder
+	window = ("2000 01 15 00 00 00","2000 01 15 02 00 00",10)
+	df = shadowcached('pbo',window,shdpath=shdpath,cachedir=str(tmp_path))
+	assert [fn.endswith('.pkl') for fn in os.listdir(tmp_path)] == [True]
+	LYAO_inputsbuilder._shdcache.clear()
+	assert shadowcached('pbo',window,shdpath='/nonexistent/',cachedir=str(tmp_path)).equals(df)
@@ -0,0 +1,98 @@
+## lyao command line & the helpers it runs on
+
+import os, json
+import numpy as np
+import pytest
+import lyao
+from datetime import datetime, timedelta
+from lyao_store import storeopen
+from LYAO_sweep import casekey, casedone, journalread, journalwrite, savepath, fileprefix, LYAOinputs, LYAOoutputs
+from LYAO_inputsbuilder import shdbatch, shdparser, twilightindex, twilightwindows, dt2tod, USNOparser
+
+def test_sweep_queue_creates_store(tmp_path):
+	storedir = str(tmp_path/'store')
+	status = lyao.main(['sweep','--doys','1','3','--f107s','70','210','--Aps','5','--tms','PM',
+		'--savedir',str(tmp_path/'save'),'--storedir',storedir,'--queue',str(tmp_path/'q.db')])
+	assert status == 0
+	axes = storeopen(storedir)['axes']
+	assert (axes['doys'],axes['f107s'],axes['Aps'],axes['tms']) == ([1,2,3],[70.,210.],[5.],['PM'])
+
+def test_sweep_storedir(tmp_path,shdpath,lyaopath):
+	storedir = str(tmp_path/'store')
+	args = ['sweep','--doys','80','81','--f107s','70','--savedir',str(tmp_path/'save'),'--storedir',storedir,
+		'--LYAOpath',lyaopath,'--shdpath',shdpath,'--nworkers','2']
+	assert lyao.main(args) == 0
+	store = storeopen(storedir)
+	assert store['done'].all()
+	assert np.isfinite(store['Ha_int'][...,0]).all()
+	# A second sweep adds to the existing store
+	assert lyao.main(args) == 0
+
+## Shadow output parsing
+#  Shadow prints the sign of a dms value on its first field only, so "-00D 30'" is -0.5 deg
+shdline = ("ra/dec +01H 59M 59.999S -00D 30' 00.000\" shadow distance   2437.252 km altitude   1617.820 km "
+	"targ az -130.3 zd   55.9 sun az  -76.2 zd  135.0 diff-az   54.1 utc 2000 01 15 03 00 00.001 "
+	"last +04H 36M 51.584S vlsr 38.057389 km/s l/b +10H 29M 56.380S -58D 41' 38.880\" ha 2.6135547806842\n")
+
+def test_shdbatch_matches_shdparser():
+	other = shdline.replace("-00D 30'","+12D 30'").replace("2000 01 15 03","2000 01 15 04")
+	df = shdbatch(shdline+other)
+	for i,line in enumerate([shdline,other]):
+		row = shdparser(line)
+		assert list(row) == list(df.columns)
+		assert all(row[k] == df[k][i] for k in df.columns)
+	assert df.dec[0] == -0.5 and df.dec[1] == 12.5
+	assert np.isclose(df.glat[0],-(58+41/60+38.88/3600))
+	assert np.isclose(df.ra[0],1+59/60+59.999/3600)
+
+## Twilight windows: the vectorized index against dt2tod, day by day, on the shipped calendars
+usnodir = os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','..','USNO')
+
+@pytest.mark.parametrize('cal,UTCoffset,dst,option',[('CTIO-2000',4,(),'default'),('CTIO-2000',4,(),'ctio'),
+	('KPNO-2000',7,(),'default'),('PBO-2000',6,range(93,304),'default'),('PBO-2001',6,range(91,302),'default')])
+def test_twilightindex_matches_dt2tod(cal,UTCoffset,dst,option):
+	fpath = os.path.join(usnodir,cal+'-Nautical-Twilight-USNO.txt')
+	year = int(cal.split('-')[1])
+	index = twilightindex(fpath,year,UTCoffset,dst=dst,UTCdst=UTCoffset-1,option=option)
+	usnodf = USNOparser(fpath)
+	for i,(dawn,dusk,midnight) in enumerate(zip(*twilightwindows(index))):
+		dt = datetime(year,1,1)+timedelta(days=i)
+		offset = UTCoffset-1 if i+1 in dst else UTCoffset
+		assert [dawn,dusk,midnight] == dt2tod(dt,usnodf,offset,option), dt
+
+## Completion journal: a case is skipped only while its inputs, geometry & saved files are unchanged
+def test_journal_skips_and_reruns(tmp_path):
+	savedir,journal = str(tmp_path/'save'),str(tmp_path/'journal.jsonl')
+	case = {'observer':'pbo','doy':'15','f107':70.,'Ap':5.,'tm':'PM','dt':datetime(2000,1,15,4),
+		'tmint':["2000 01 14 23 30 00","2000 01 15 06 00 00",10]}
+	assert casekey(case) == 'pbo|15|70.0|5.0|PM'
+	tmpath = savepath(savedir,case)
+	os.makedirs(tmpath)
+	for fn in LYAOinputs+LYAOoutputs:
+		with open(os.path.join(tmpath,fileprefix(case)+fn),'w') as id:
+			id.write(fn+'\n')
+	assert not casedone(case,journalread(journal),savedir)
+	journalwrite(journal,case,0,savedir)
+	assert casedone(case,journalread(journal),savedir)
+
+	## Changed RT inputs or geometry
+	for key,val in [('f107',120.),('dt',datetime(2000,1,15,5)),('tmint',case['tmint'][:2]+[20]),('losplan',{'n':48})]:
+		assert not casedone(dict(case,**{key:val}),journalread(journal),savedir), key
+	assert casedone(case,journalread(journal),savedir)
+
+	## An edited saved file
+	fpath = os.path.join(tmpath,fileprefix(case)+LYAOoutputs[0])
+	with open(fpath,'a') as id:
+		id.write('edited\n')
+	assert not casedone(case,journalread(journal),savedir)
+	journalwrite(journal,case,0,savedir)
+	assert casedone(case,journalread(journal),savedir)
+
+	## A failed run, then a partial trailing line from a sweep that died mid-write
+	journalwrite(journal,case,1,savedir)
+	assert not casedone(case,journalread(journal),savedir)
+	journalwrite(journal,case,0,savedir)
+	with open(journal,'a') as id:
+		id.write('{"key": "%s", "status": 1'%casekey(case))
+	assert journalread(journal)[casekey(case)]['status'] == 0
+	assert casedone(case,journalread(journal),savedir)
@@ -0,0 +1,28 @@
+## lyao_parse lazy parsing
+
+import shutil
+import pytest
+from lyao_parse import *
+
+example = os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','..','LYAO_RT')
+
+def test_lazy_parse_error_repeats(tmp_path):
+	los = Los(str(tmp_path/'hab_los.dat'))
+	for attempt in range(2):
+		with pytest.raises(FileNotFoundError):
+			los.Ha_int
+	# A file that turns up later is parsed on the next access
+	shutil.copy(os.path.join(example,'hab_los.dat'),str(tmp_path))
+	assert len(los.Ha_int) == 12
+
+def test_cachewrite_replaces_atomically(tmp_path):
+	fpath = str(tmp_path/'cache'/'x.pkl')
+	cachewrite(fpath,lambda id: id.write(b'one'))
+	cachewrite(fpath,lambda id: id.write(b'two'))
+	def fail(id):
+		id.write(b'partial')
+		raise RuntimeError('interrupted')
+	with pytest.raises(RuntimeError):
+		cachewrite(fpath,fail)
+	assert open(fpath,'rb').read() == b'two'
+	assert os.listdir(str(tmp_path/'cache')) == ['x.pkl']
@@ -0,0 +1,48 @@
+## LYAO_queue publishing: lease ownership & per-case failures
+
+import os, json
+from datetime import datetime
+from LYAO_queue import *
+
+def makecase(doy):
+	return {'observer':'pbo','doy':str(doy),'f107':70.,'Ap':5,'tm':'AM','dt':datetime(2000,1,doy,11),
+		'tmint':["2000 01 %02i 06 00 00"%doy,"2000 01 %02i 08 00 00"%doy,10],'Apdir':False,'losplan':None}
+
+def test_lost_lease_publishes_nothing(tmp_path):
+	db,journal = str(tmp_path/'q.db'),str(tmp_path/'journal.jsonl')
+	enqueue(db,[makecase(1)],str(tmp_path))
+	conn = queueconnect(db)
+	jobid,case,savedir = claim(conn,'other:1')
+	assert publish(conn,jobid,'me:2',case,savedir,0,[],journal=journal) is None
+	assert not os.path.exists(journal)
+	assert conn.execute('SELECT state,worker FROM jobs').fetchone() == ('running','other:1')
+
+def test_store_failure_fails_case(tmp_path):
+	db,journal,storedir = str(tmp_path/'q.db'),str(tmp_path/'journal.jsonl'),str(tmp_path/'store')
+	storecreate(storedir,[1],[70.],[5.])
+	enqueue(db,[makecase(2)],str(tmp_path))
+	conn = queueconnect(db)
+	jobid,case,savedir = claim(conn,'me:1')
+	records = []
+	assert publish(conn,jobid,'me:1',case,savedir,0,records,storedir=storedir,journal=journal) == 1
+	assert 'not on the store axes' in records[-1]['traceback']
+	assert json.loads(open(journal).readline())['status'] == 1
+	assert conn.execute('SELECT state,status FROM jobs').fetchone() == ('failed',1)
+	assert 'traceback' in json.loads(conn.execute('SELECT telemetry FROM jobs').fetchone()[0])[-1]
+
+def test_heartbeat_survives_locked_database(tmp_path,monkeypatch):
+	# The first renewal hits a locked database; the heartbeat keeps renewing after it
+	import LYAO_queue
+	calls = []
+	def flaky(conn,jobid,worker,lease=qlease):
+		calls.append(time.time())
+		if len(calls) == 1:
+			raise sqlite3.OperationalError('database is locked')
+		return renew(conn,jobid,worker,lease)
+	monkeypatch.setattr(LYAO_queue,'renew',flaky)
+	monkeypatch.setattr(LYAO_queue,'runcase',lambda *args: time.sleep(0.5) or 0)
+	db = str(tmp_path/'q.db')
+	enqueue(db,[makecase(1)],str(tmp_path))
+	assert worker(db,str(tmp_path),str(tmp_path),lease=0.15) == 1
+	assert len(calls) > 2
+	assert queueconnect(db).execute('SELECT state FROM jobs').fetchone() == ('done',)
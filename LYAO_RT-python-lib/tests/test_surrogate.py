@@ -0,0 +1,34 @@
+## lyao_surrogate: building from a partly filled store
+
+import numpy as np
+import pytest
+from lyao_store import *
+from lyao_surrogate import *
+
+def fill(store,idx,z):
+	store['shdalt'][idx] = np.nan
+	store['Ha_int'][idx] = np.nan
+	store['shdalt'][idx+(slice(0,len(z)),)] = z
+	store['Ha_int'][idx+(slice(0,len(z)),)] = np.exp(-z/500)
+	store['done'][idx] = True
+
+def test_surrogate_partly_filled_store(tmp_path):
+	store = storecreate(str(tmp_path/'store'),[10,20,30],[70.],[5.],tms=['PM'],nlos=8)
+	with pytest.raises(ValueError,match='no completed runs'):
+		surrogatebuild(store)
+
+	## Two of three runs done: the surrogate covers their common range, NaN in the empty cells
+	fill(store,(0,0,0,0),np.linspace(100.,1000.,6))
+	fill(store,(1,0,0,0),np.linspace(200.,1200.,8))
+	sur = surrogatebuild(store,nalt=10)
+	assert sur['axes']['shdalt'][0] == 200. and sur['axes']['shdalt'][-1] == 1000.
+	I,inside = surrogateeval(sur,doy=[10,15],f107=70.,Ap=5.,shdalt=400.,tm='PM')
+	assert np.all(inside) and np.allclose(I,np.exp(-400./500),rtol=0.02)
+	I,inside = surrogateeval(sur,doy=25,f107=70.,Ap=5.,shdalt=400.,tm='PM')
+	assert not inside and np.isnan(I)
+
+	## A run that doesn't overlap the others leaves no common shadow altitude range
+	fill(store,(2,0,0,0),np.linspace(2000.,3000.,5))
+	with pytest.raises(ValueError,match='no shadow altitude range'):
+		surrogatebuild(store)
+	assert len(surrogatebuild(store,shdalts=np.linspace(200.,1000.,5))['axes']['shdalt']) == 5
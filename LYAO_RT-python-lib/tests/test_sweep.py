@@ -0,0 +1,61 @@
+## LYAO_sweep: LOS planning into a store
+
+import numpy as np
+import pandas as pd
+import shutil
+from datetime import datetime
+from LYAO_sweep import *
+
+def test_losplan_thinned_to_nmax():
+	n = 600
+	shdwdf = pd.DataFrame({col:np.zeros(n) for col in loscols})
+	shdwdf['shdalt'] = np.linspace(100.,12000.,n)
+	shdwdf['utc'] = ['2000 01 01 00 00 00.000']*n
+	assert len(losplan(shdwdf,dz=10)) > 1000
+	losdf = losplan(shdwdf,dz=10,nmax=144)
+	assert len(losdf) == 144
+	assert np.all(np.diff(losdf.shdalt) > 0)
+
+def test_losrefine_keeps_worst_rows():
+	z = np.linspace(100.,5000.,50)
+	I = np.exp(-z/500)
+	new = losrefine(z,I,0.001)
+	assert len(new) > 10
+	kept = losrefine(z,I,0.001,nmax=4)
+	assert len(kept) == 4 and np.all(kept < np.sort(new)[6])
+
+def test_losplan_example_into_store(tmp_path,shdpath,lyaopath):
+	# The losplan example in LYAO_iterate.py over an evening window from ~150 to ~11000 km
+	plan = {'n':48,'refine':0.01,'levels':3}
+	case = {'observer':'pbo','doy':'15','f107':70.,'Ap':5.,'tm':'PM','dt':datetime(2000,1,15,4),
+		'tmint':["2000 01 14 23 30 00","2000 01 15 06 00 00",10],'Apdir':False,'losplan':plan}
+	storedir = str(tmp_path/'store')
+	store = storecreate(storedir,[15],[70.],[5.],tms=['PM'])
+	scratch = scratchdir(lyaopath,shdpath)
+	records = []
+	try:
+		status = runcase(case,scratch,str(tmp_path/'save'),records=records)
+	finally:
+		shutil.rmtree(scratch,ignore_errors=True)
+	assert status == 0
+	assert any(rec['stage'] == 'test_los' and rec.get('refine',0) >= 1 for rec in records)
+	storeadd(store,savepath(str(tmp_path/'save'),case),case['doy'],case['f107'],case['Ap'],case['tm'])
+	z = store['shdalt'][0,0,0,0]
+	z = np.sort(z[np.isfinite(z)])
+	assert 48 < len(z) <= 144 and z[-1] > 1000.
+	dz = np.diff(z)
+	# Refined rows go where Ha_int bends, not into the flat tail
+	assert np.median(dz[z[1:] < 500]) < np.median(dz[z[1:] > 5000])
+
+def test_store_overflow_fails_case(tmp_path,shdpath,lyaopath):
+	# A plan allowed more rows than the store holds fails its case without stopping the sweep
+	plans = [{'dz':10,'nmax':2000},{'dz':100}]
+	cases = [{'observer':'pbo','doy':str(doy),'f107':70.,'Ap':5.,'tm':'PM','dt':datetime(2000,1,doy,4),
+		'tmint':["2000 01 %02i 00 30 00"%doy,"2000 01 %02i 06 00 00"%doy,10],'Apdir':False,'losplan':plan}
+		for doy,plan in zip([15,16],plans)]
+	storedir = str(tmp_path/'store')
+	storecreate(storedir,[15,16],[70.],[5.],tms=['PM'])
+	results = sweep(cases,str(tmp_path/'save'),lyaopath,shdpath,nworkers=1,storedir=storedir,
+		journal=str(tmp_path/'journal.jsonl'))
+	assert sorted((case['doy'],status) for case,status in results) == [('15',1),('16',0)]
+	assert list(storeopen(storedir)['done'][:,0,0,0]) == [False,True]